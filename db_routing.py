@@ -0,0 +1,79 @@
+"""
+Database Routing
+Decides whether get_db() may hand out a read-only connection: to the
+replica on PostgreSQL (DATABASE_REPLICA_URL), or a read-only SQLite handle.
+
+Routes opt in with @read_only. A session that wrote recently keeps reading
+from the primary for READ_YOUR_WRITES_SECONDS so it never sees stale data
+from a lagging replica. The recent-writes window is tracked per worker,
+so verify_token() also checks the primary before rejecting a session the
+replica doesn't have yet.
+
+An unreachable replica is given REPLICA_CONNECT_TIMEOUT seconds to answer
+and is then skipped for REPLICA_RETRY_SECONDS, so read-only pages go
+straight to the primary while it is down.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', '5'))
+# libpq rounds connect timeouts below 2 seconds up to 2
+REPLICA_CONNECT_TIMEOUT = int(os.environ.get('REPLICA_CONNECT_TIMEOUT', '2'))
+REPLICA_RETRY_SECONDS = float(os.environ.get('REPLICA_RETRY_SECONDS', '30'))
+
+
+def read_only(view):
+    """Mark a route as read-only so its queries can go to the replica"""
+    view.read_only = True
+    return view
+
+
+class RecentWrites:
+    """Sessions that wrote within the last READ_YOUR_WRITES_SECONDS"""
+
+    def __init__(self, window=None):
+        self.window = READ_YOUR_WRITES_SECONDS if window is None else window
+        self._until = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(session):
+        return hashlib.sha256(str(session).encode()).hexdigest()[:16]
+
+    def mark(self, session):
+        if not session or self.window <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._until[self._key(session)] = now + self.window
+            if len(self._until) > 1000:
+                self._until = {key: until for key, until in self._until.items() if until > now}
+
+    def recent(self, session):
+        if not session:
+            return False
+        with self._lock:
+            until = self._until.get(self._key(session))
+        return until is not None and until > time.monotonic()
+
+
+class ReplicaBackoff:
+    """Stop trying the replica for a while after a failed connect"""
+
+    def __init__(self, seconds=None):
+        self.seconds = REPLICA_RETRY_SECONDS if seconds is None else seconds
+        self._until = 0.0
+
+    def available(self):
+        return time.monotonic() >= self._until
+
+    def failed(self):
+        self._until = time.monotonic() + self.seconds
+
+
+recent_writes = RecentWrites()
+replica_backoff = ReplicaBackoff()
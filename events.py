@@ -0,0 +1,219 @@
+"""
+Events
+In-memory pieces behind event-scoped attendance: a name/id directory,
+live per-event counters and a broadcaster that pushes new scans to admin
+dashboards over Server-Sent Events.
+
+All of this is per worker process. Counters are seeded from the database
+and re-seeded every EVENT_COUNTER_REFRESH_SECONDS, so scans handled by
+other workers show up within that window.
+
+In server.py every open stream holds a worker thread, so at most
+SSE_MAX_CLIENTS streams run per worker and each one ends after
+SSE_MAX_SECONDS (the browser reconnects on its own). The async server
+serves streams on its event loop, where they cost no thread.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+
+EVENT_COUNTER_REFRESH_SECONDS = int(os.environ.get('EVENT_COUNTER_REFRESH_SECONDS', '30'))
+SSE_HEARTBEAT_SECONDS = int(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_MAX_CLIENTS = int(os.environ.get('SSE_MAX_CLIENTS', '4'))
+SSE_MAX_SECONDS = int(os.environ.get('SSE_MAX_SECONDS', '300'))
+SSE_QUEUE_SIZE = 100
+
+
+class EventDirectory:
+    """Cache of event id <-> name so most scans resolve their event without a query"""
+
+    def __init__(self):
+        self._by_id = {}
+        self._by_name = {}
+        self._lock = threading.Lock()
+
+    def get(self, event_id=None, name=None):
+        """Return (id, name) if the event is cached, else None"""
+        with self._lock:
+            if event_id is not None:
+                cached = self._by_id.get(int(event_id))
+                return (int(event_id), cached) if cached is not None else None
+            cached = self._by_name.get((name or '').strip())
+            return (cached, name.strip()) if cached is not None else None
+
+    def add(self, event_id, name):
+        with self._lock:
+            self._by_id[event_id] = name
+            self._by_name[name] = event_id
+
+
+class EventCounters:
+    """Live granted / denied / unique attendee counts per event
+
+    loader(event_id) returns (granted, denied, member_numbers_granted) from
+    the database and is used to seed and periodically re-seed a counter.
+    """
+
+    def __init__(self, loader=None, refresh_seconds=None):
+        self.loader = loader
+        self.refresh_seconds = EVENT_COUNTER_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _ensure(self, event_id):
+        """Seed the counter if missing or stale; True if it was (re)loaded"""
+        with self._lock:
+            entry = self._counts.get(event_id)
+            if entry and time.monotonic() - entry['loaded_at'] < self.refresh_seconds:
+                return False
+        # Query outside the lock so one slow seed doesn't stall every scan
+        granted, denied, attendees = self.loader(event_id) if self.loader else (0, 0, set())
+        with self._lock:
+            self._counts[event_id] = {
+                'granted': granted,
+                'denied': denied,
+                'attendees': set(attendees),
+                'loaded_at': time.monotonic(),
+            }
+        return True
+
+    def record(self, event_id, member_number, status):
+        """Count a scan that has just been committed"""
+        if self._ensure(event_id):
+            # A fresh seed already includes this scan
+            return self.snapshot(event_id)
+        with self._lock:
+            entry = self._counts[event_id]
+            if status == 'granted':
+                entry['granted'] += 1
+                entry['attendees'].add(member_number)
+            else:
+                entry['denied'] += 1
+        return self.snapshot(event_id)
+
+    def snapshot(self, event_id):
+        self._ensure(event_id)
+        with self._lock:
+            entry = self._counts[event_id]
+            return {
+                'event_id': event_id,
+                'granted': entry['granted'],
+                'denied': entry['denied'],
+                'unique_attendees': len(entry['attendees']),
+            }
+
+
+class _AsyncSubscriber:
+    """Subscriber queue on an asyncio loop; publish() may run in any thread"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+
+    def put_nowait(self, data):
+        self.loop.call_soon_threadsafe(self._put, data)
+
+    def _put(self, data):
+        try:
+            self.queue.put_nowait(data)
+        except asyncio.QueueFull:
+            pass
+
+
+class ScanBroadcaster:
+    """Fan new scans out to every connected SSE client
+
+    Each client gets a bounded queue; a client that stops reading loses
+    messages rather than holding up the scanner. Thread-bound clients are
+    capped at max_clients so streams can't take every worker thread.
+    """
+
+    def __init__(self, max_clients=None):
+        self.max_clients = SSE_MAX_CLIENTS if max_clients is None else max_clients
+        self._subscribers = set()
+        self._threaded = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Queue for a stream served from a worker thread, or None if the cap is reached"""
+        with self._lock:
+            if self._threaded >= self.max_clients:
+                return None
+            subscriber = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+            self._threaded += 1
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def subscribe_async(self):
+        """Queue for a stream served from the running asyncio loop"""
+        subscriber = _AsyncSubscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.discard(subscriber)
+                if isinstance(subscriber, queue.Queue):
+                    self._threaded -= 1
+
+    def publish(self, message):
+        data = json.dumps(message, default=str)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(data)
+            except queue.Full:
+                pass
+            except RuntimeError:
+                # Its event loop has shut down
+                self.unsubscribe(subscriber)
+
+    def stream(self, subscriber):
+        """Yield SSE frames for one client until it disconnects or SSE_MAX_SECONDS pass"""
+        try:
+            yield 'retry: 3000\n\n'
+            deadline = time.monotonic() + SSE_MAX_SECONDS
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    data = subscriber.get(timeout=min(SSE_HEARTBEAT_SECONDS, remaining))
+                    yield f'event: scan\ndata: {data}\n\n'
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def stream_async(self, subscriber):
+        """Async version of stream() for the ASGI server"""
+        try:
+            yield 'retry: 3000\n\n'
+            deadline = time.monotonic() + SSE_MAX_SECONDS
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    data = await asyncio.wait_for(subscriber.queue.get(), min(SSE_HEARTBEAT_SECONDS, remaining))
+                    yield f'event: scan\ndata: {data}\n\n'
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+event_directory = EventDirectory()
+event_counters = EventCounters()
+scan_broadcaster = ScanBroadcaster()
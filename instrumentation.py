@@ -0,0 +1,364 @@
+"""
+Instrumentation
+Structured logging, Prometheus-style metrics, database timing and an
+opt-in sampling profiler for the membership server.
+
+Nothing in here depends on Flask so the same pieces can be wired into any
+serving mode. Metrics are kept per process; with several gunicorn workers
+each worker exposes its own numbers.
+"""
+
+import atexit
+import bisect
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+
+# ============= LOGGING =============
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', '0.25'))
+
+_listener = None
+
+
+def _quote(value):
+    """Quote a log value only when it contains whitespace or quotes"""
+    text = str(value)
+    if not text or any(c in text for c in ' "='):
+        return '"' + text.replace('"', '\\"') + '"'
+    return text
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Format records as key=value pairs that log tooling can parse"""
+
+    def format(self, record):
+        fields = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        fields.update(getattr(record, 'fields', None) or {})
+        line = ' '.join(f'{key}={_quote(value)}' for key, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging():
+    """Send 'mhs' logs through a queue so request threads never block on stdout"""
+    global _listener
+    logger = logging.getLogger('mhs')
+    if _listener is not None:
+        return logger
+
+    logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    logger.propagate = False
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(KeyValueFormatter())
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return logger
+
+
+def get_logger(name):
+    """Get a child of the 'mhs' logger"""
+    configure_logging()
+    return logging.getLogger(f'mhs.{name}')
+
+
+def log_event(logger, level, msg, **fields):
+    """Log a message with structured fields, skipping all work if the level is off"""
+    if logger.isEnabledFor(level):
+        logger.log(level, msg, extra={'fields': fields})
+
+
+log = get_logger('instrumentation')
+
+# ============= METRICS =============
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_key(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    body = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return '{' + body + '}'
+
+
+class Metrics:
+    """Thread-safe in-process registry of counters, gauges and histograms"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, help_text, buckets=DEFAULT_BUCKETS):
+        """Register a metric name with its type and help text"""
+        with self._lock:
+            self._meta[name] = (kind, help_text, tuple(buckets))
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, labels=None):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def add_gauge(self, name, delta, labels=None):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name, value, labels=None):
+        key = (name, _label_key(labels))
+        with self._lock:
+            buckets = self._meta.get(name, (None, None, DEFAULT_BUCKETS))[2]
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * len(buckets), 0.0, 0]
+            index = bisect.bisect_left(buckets, value)
+            if index < len(buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def value(self, name, labels=None):
+        """Current value of a counter or gauge (0 if never touched)"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key, 0))
+
+    def render(self):
+        """Render everything in the Prometheus text exposition format"""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: (list(e[0]), e[1], e[2]) for key, e in self._histograms.items()}
+            meta = dict(self._meta)
+
+        lines = []
+        seen = set()
+
+        def header(name, default_kind):
+            if name in seen:
+                return
+            seen.add(name)
+            kind, help_text, _ = meta.get(name, (default_kind, None, None))
+            if help_text:
+                lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        for (name, key), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f'{name}{_format_labels(key)} {value}')
+
+        for (name, key), value in sorted(gauges.items()):
+            header(name, 'gauge')
+            lines.append(f'{name}{_format_labels(key)} {value}')
+
+        for (name, key), (bucket_counts, total, count) in sorted(histograms.items()):
+            header(name, 'histogram')
+            buckets = meta.get(name, (None, None, DEFAULT_BUCKETS))[2]
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_format_labels(key, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(key, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_format_labels(key)} {total}')
+            lines.append(f'{name}_count{_format_labels(key)} {count}')
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+metrics.describe('http_requests_total', 'counter', 'HTTP requests by route, method and status')
+metrics.describe('http_request_duration_seconds', 'histogram', 'HTTP request latency by route and method')
+metrics.describe('http_requests_in_flight', 'gauge', 'HTTP requests currently being served')
+metrics.describe('db_connect_seconds', 'histogram', 'Time spent acquiring a database connection')
+metrics.describe('db_connect_failures_total', 'counter', 'Failed database connection attempts')
+metrics.describe('db_query_duration_seconds', 'histogram', 'Time spent executing database statements')
+metrics.describe('db_route_total', 'counter', 'Connections handed out by get_db() per target (primary, replica, readonly)')
+metrics.describe('replica_session_miss_total', 'counter', 'Sessions not yet on the replica that were found on the primary')
+
+# ============= DATABASE TIMING =============
+
+
+def _statement_kind(query):
+    """First SQL keyword of a statement, used as a low-cardinality label"""
+    words = query.lstrip().split(None, 1)
+    return words[0].upper() if words else 'UNKNOWN'
+
+
+class TimedCursor:
+    """Cursor proxy that times every execute() call"""
+
+    def __init__(self, cursor, backend):
+        self._cursor = cursor
+        self._backend = backend
+
+    def _timed(self, method, query, args):
+        start = time.perf_counter()
+        try:
+            return method(query, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            kind = _statement_kind(query)
+            metrics.observe('db_query_duration_seconds', elapsed,
+                            {'backend': self._backend, 'statement': kind})
+            if elapsed >= SLOW_QUERY_SECONDS:
+                log_event(log, logging.WARNING, 'slow query', backend=self._backend,
+                          statement=kind, seconds=round(elapsed, 4),
+                          query=' '.join(query.split())[:200])
+
+    def execute(self, query, *args):
+        return self._timed(self._cursor.execute, query, args)
+
+    def executemany(self, query, *args):
+        return self._timed(self._cursor.executemany, query, args)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TimedConnection:
+    """Connection proxy whose cursors are TimedCursors"""
+
+    def __init__(self, conn, backend):
+        self._conn = conn
+        self.backend = backend
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs), self.backend)
+
+    def __setattr__(self, name, value):
+        # Settings such as sqlite3's row_factory belong to the real connection
+        if name in ('_conn', 'backend'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def timed_connect(backend, connect, *args, **kwargs):
+    """Open a connection through connect() and record how long it took"""
+    start = time.perf_counter()
+    try:
+        conn = connect(*args, **kwargs)
+    except Exception:
+        metrics.inc('db_connect_failures_total', {'backend': backend})
+        raise
+    finally:
+        metrics.observe('db_connect_seconds', time.perf_counter() - start, {'backend': backend})
+    return TimedConnection(conn, backend)
+
+# ============= SAMPLING PROFILER =============
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILE_INTERVAL_SECONDS = float(os.environ.get('PROFILE_INTERVAL_MS', '5')) / 1000
+
+# Only one request is profiled at a time; others run normally
+_profile_slot = threading.Lock()
+last_profile = None
+
+
+class SamplingProfiler:
+    """Periodically sample one thread's stack and fold the samples
+
+    Output uses the collapsed-stack format understood by flamegraph tools:
+    one line per distinct stack, frames joined with ';', then the count.
+    """
+
+    def __init__(self, thread_id, interval=None):
+        self.thread_id = thread_id
+        self.interval = interval or PROFILE_INTERVAL_SECONDS
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def folded(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common())
+
+
+def try_start_profile():
+    """Start profiling the current thread if profiling is on and no other request holds the slot"""
+    if not PROFILING_ENABLED or not _profile_slot.acquire(blocking=False):
+        return None
+    return SamplingProfiler(threading.get_ident()).start()
+
+
+def finish_profile(profiler, route, elapsed):
+    """Stop a profiler, keep its result as the latest profile and free the slot"""
+    global last_profile
+    try:
+        profiler.stop()
+        last_profile = {
+            'route': route,
+            'seconds': round(elapsed, 4),
+            'samples': sum(profiler.samples.values()),
+            'folded': profiler.folded(),
+        }
+        log_event(log, logging.INFO, 'request profiled', route=route,
+                  seconds=last_profile['seconds'], samples=last_profile['samples'])
+    finally:
+        _profile_slot.release()
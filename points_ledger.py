@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Points Ledger
+Every points change is appended to points_ledger instead of updating
+members.points in place, so busy gates never queue on a member's row lock.
+
+members.points is a materialized balance: a background job folds new
+ledger rows into it in batches and flags them as materialized. Balances
+shown to members add the not-yet-materialized rows, so they stay exact.
+Ledger amounts are never changed; only the materialized flag is set.
+
+Check or repair balances from the command line:
+    python points_ledger.py verify
+    python points_ledger.py recompute
+"""
+
+import logging
+import os
+import sys
+import threading
+
+from instrumentation import get_logger, log_event, metrics
+
+log = get_logger('points_ledger')
+
+POINTS_BATCH_SECONDS = float(os.environ.get('POINTS_BATCH_SECONDS', '5'))
+POINTS_BATCH_SIZE = int(os.environ.get('POINTS_BATCH_SIZE', '500'))
+
+
+def _param(postgres):
+    return '%s' if postgres else '?'
+
+
+def _lock(cursor, postgres):
+    """Stop other writers to the ledger for the rest of the transaction"""
+    if postgres:
+        cursor.execute('LOCK TABLE points_ledger IN SHARE ROW EXCLUSIVE MODE')
+    else:
+        cursor.execute('BEGIN IMMEDIATE')
+
+
+def append(cursor, postgres, member_id, member_number, points, reason):
+    """Record a points change - the caller commits with the rest of its transaction"""
+    p = _param(postgres)
+    cursor.execute(f'''
+        INSERT INTO points_ledger (member_id, member_number, points, reason)
+        VALUES ({p}, {p}, {p}, {p})
+    ''', (member_id, member_number, points, reason))
+
+
+BALANCE_QUERY = '''
+    SELECT COALESCE(m.points, 0) + COALESCE((
+        SELECT SUM(points) FROM points_ledger
+        WHERE member_id = m.id AND materialized = 0
+    ), 0)
+    FROM members m WHERE m.id = {p}
+'''
+
+
+def balance(cursor, postgres, member_id):
+    """A member's materialized balance plus the rows not yet folded into it
+
+    Read in one statement: reading the two halves separately could see a
+    batch on one side of the materializer and not the other.
+    """
+    cursor.execute(BALANCE_QUERY.format(p=_param(postgres)), (member_id,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def materialize(conn, postgres, batch_size=None):
+    """Fold one batch of new ledger rows into members.points; returns rows applied"""
+    p = _param(postgres)
+    cursor = conn.cursor()
+    try:
+        # PostgreSQL workers each claim different rows and never block
+        # scans; SQLite has a single writer anyway
+        if not postgres:
+            _lock(cursor, postgres)
+        cursor.execute(f'''
+            SELECT id, member_id, points FROM points_ledger
+            WHERE materialized = 0
+            ORDER BY id
+            LIMIT {p}
+            {'FOR UPDATE SKIP LOCKED' if postgres else ''}
+        ''', (batch_size or POINTS_BATCH_SIZE,))
+        rows = cursor.fetchall()
+        if not rows:
+            conn.rollback()
+            return 0
+
+        totals = {}
+        for row in rows:
+            totals[row[1]] = totals.get(row[1], 0) + row[2]
+
+        # Lock members in id order so two workers' batches can't deadlock
+        cursor.executemany(
+            f'UPDATE members SET points = COALESCE(points, 0) + {p} WHERE id = {p}',
+            [(total, member_id) for member_id, total in sorted(totals.items())]
+        )
+        cursor.executemany(
+            f'UPDATE points_ledger SET materialized = 1 WHERE id = {p}',
+            [(row[0],) for row in rows]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    metrics.inc('points_ledger_materialized_total', value=len(rows))
+    return len(rows)
+
+
+def verify(conn, postgres):
+    """Members whose materialized balance doesn't match their ledger"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT m.id, m.member_number, COALESCE(m.points, 0), COALESCE(l.total, 0)
+        FROM members m
+        LEFT JOIN (
+            SELECT member_id, SUM(points) AS total FROM points_ledger
+            WHERE materialized = 1
+            GROUP BY member_id
+        ) l ON l.member_id = m.id
+        WHERE COALESCE(m.points, 0) <> COALESCE(l.total, 0)
+    ''')
+    return [
+        {'member_id': row[0], 'member_number': row[1], 'balance': row[2], 'ledger': row[3]}
+        for row in cursor.fetchall()
+    ]
+
+
+def recompute(conn, postgres):
+    """Materialize everything pending, then reset any drifted balance from the ledger"""
+    while materialize(conn, postgres):
+        pass
+
+    cursor = conn.cursor()
+    try:
+        _lock(cursor, postgres)
+        mismatches = verify(conn, postgres)
+        p = _param(postgres)
+        cursor.executemany(f'''
+            UPDATE members SET points = (
+                SELECT COALESCE(SUM(points), 0) FROM points_ledger
+                WHERE member_id = members.id AND materialized = 1
+            )
+            WHERE id = {p}
+        ''', [(m['member_id'],) for m in mismatches])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return mismatches
+
+
+class Materializer:
+    """Background thread that runs materialize() every POINTS_BATCH_SECONDS"""
+
+    def __init__(self, connect, postgres, interval=None):
+        self.connect = connect
+        self.postgres = postgres
+        self.interval = POINTS_BATCH_SECONDS if interval is None else interval
+        self._started = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start once per process (safe to call on every request)"""
+        if self._started or self.interval <= 0:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            threading.Thread(target=self._run, daemon=True, name='points-materializer').start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                conn = self.connect()
+                try:
+                    while materialize(conn, self.postgres) == POINTS_BATCH_SIZE:
+                        pass
+                finally:
+                    conn.close()
+            except Exception as e:
+                log_event(log, logging.ERROR, 'points materialize failed', error=str(e))
+
+
+metrics.describe('points_ledger_materialized_total', 'counter', 'Ledger rows folded into member balances')
+
+
+def main():
+    from server import get_db, IS_RENDER
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'verify'
+    conn = get_db(readonly=False)
+    try:
+        if command == 'verify':
+            mismatches = verify(conn, IS_RENDER)
+        elif command == 'recompute':
+            mismatches = recompute(conn, IS_RENDER)
+        else:
+            print(f"Unknown command: {command} (use verify or recompute)")
+            sys.exit(2)
+    finally:
+        conn.close()
+
+    for m in mismatches:
+        print(f"{m['member_number']}: balance {m['balance']}, ledger {m['ledger']}")
+    if command == 'recompute':
+        print(f"✅ Recomputed {len(mismatches)} balance(s)")
+    elif mismatches:
+        print(f"❌ {len(mismatches)} balance(s) differ from the ledger")
+        sys.exit(1)
+    else:
+        print("✅ All balances match the ledger")
+
+
+if __name__ == '__main__':
+    main()
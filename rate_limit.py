@@ -0,0 +1,218 @@
+"""
+Rate Limiting
+Token-bucket limits per client and route, plus a global admission gate
+that sheds load before every worker thread is stuck waiting on the database.
+
+Buckets live in process memory by default. Set RATE_LIMIT_REDIS_URL to share
+them between gunicorn workers (needs the 'redis' package).
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from instrumentation import get_logger, log_event, metrics
+
+log = get_logger('rate_limit')
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1').lower() not in ('0', 'false', 'no')
+RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL')
+# Seconds to wait on Redis before letting the request through unchecked
+RATE_LIMIT_REDIS_TIMEOUT = float(os.environ.get('RATE_LIMIT_REDIS_TIMEOUT', '0.2'))
+# Threads per gunicorn worker - the Procfile passes the same value to --threads
+WEB_THREADS = int(os.environ.get('WEB_THREADS', '16'))
+# Threads left free for requests outside the gate (pages, health checks, metrics)
+ADMISSION_RESERVE = int(os.environ.get('ADMISSION_RESERVE', '2'))
+
+
+def admission_limit(capacity, reserve=None):
+    """MAX_IN_FLIGHT if set, else what a worker can serve at once minus the reserve
+
+    The cap only sheds load if it is below the worker's real concurrency:
+    its thread count for server.py, its connection pool for server_async.py.
+    """
+    if os.environ.get('MAX_IN_FLIGHT'):
+        return int(os.environ['MAX_IN_FLIGHT'])
+    reserve = ADMISSION_RESERVE if reserve is None else reserve
+    return max(1, capacity - reserve)
+
+
+def parse_rule(text):
+    """Parse 'N/S' (N requests per S seconds) into (capacity, refill per second)"""
+    count, _, seconds = text.partition('/')
+    count = float(count)
+    return count, count / float(seconds or 1)
+
+
+# Route -> (capacity, tokens per second). Login is keyed by client IP,
+# scans by session token so each scanner tablet gets its own bucket.
+ROUTE_LIMITS = {
+    '/api/login': parse_rule(os.environ.get('RATE_LIMIT_LOGIN', '10/60')),
+    '/api/scan': parse_rule(os.environ.get('RATE_LIMIT_SCAN', '20/10')),
+}
+
+
+def client_key(route, ip, token=None):
+    """Bucket key for a route, client IP and (hashed) session token"""
+    token_part = hashlib.sha256(token.encode()).hexdigest()[:16] if token else '-'
+    return f'{route}|{ip}|{token_part}'
+
+# Long-lived connections (SSE) would pin an admission slot for their whole
+# lifetime, so they are left out of the in-flight cap
+ADMISSION_EXEMPT_ROUTES = {'/api/events/stream'}
+
+
+class MemoryBuckets:
+    """Token buckets kept in this process"""
+
+    # Buckets untouched for this long are full again and can be dropped
+    IDLE_SECONDS = 600
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def take(self, key, capacity, rate, now=None):
+        """Take one token; return seconds to wait (0 when allowed)"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, last = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate
+            if now - self._last_sweep > self.IDLE_SECONDS:
+                self._sweep(now)
+            return wait
+
+    def _sweep(self, now):
+        self._last_sweep = now
+        stale = [key for key, (_, last) in self._buckets.items() if now - last > self.IDLE_SECONDS]
+        for key in stale:
+            del self._buckets[key]
+
+
+class RedisBuckets:
+    """Token buckets shared between workers through Redis
+
+    Calls block on the network (with a short timeout), so async callers
+    run them in a thread.
+    """
+
+    blocking = True
+
+    # Refill and take in one atomic step; returns seconds to wait * 1000
+    SCRIPT = '''
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'last')
+        local tokens = tonumber(state[1]) or capacity
+        local last = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + (now - last) * rate)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'last', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return math.ceil(wait * 1000)
+    '''
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(
+            url,
+            socket_timeout=RATE_LIMIT_REDIS_TIMEOUT,
+            socket_connect_timeout=RATE_LIMIT_REDIS_TIMEOUT
+        )
+        self._take = self._client.register_script(self.SCRIPT)
+
+    def take(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        return self._take(keys=[f'ratelimit:{key}'], args=[capacity, rate, now]) / 1000
+
+
+def _make_backend():
+    if RATE_LIMIT_REDIS_URL:
+        try:
+            backend = RedisBuckets(RATE_LIMIT_REDIS_URL)
+            log.info('Rate limiting through Redis')
+            return backend
+        except Exception as e:
+            log_event(log, logging.WARNING, 'redis rate limiting unavailable, using per-worker buckets',
+                      error=str(e))
+    return MemoryBuckets()
+
+
+class RateLimiter:
+    """Check requests against ROUTE_LIMITS"""
+
+    def __init__(self, backend=None, limits=None):
+        self.backend = backend or _make_backend()
+        self.limits = ROUTE_LIMITS if limits is None else limits
+
+    def blocks(self, route):
+        """True if checking this route waits on the network"""
+        return route in self.limits and getattr(self.backend, 'blocking', False)
+
+    def check(self, route, ip, token=None):
+        """Return seconds the client must wait, or 0 if the request may proceed"""
+        rule = self.limits.get(route)
+        if not RATE_LIMIT_ENABLED or rule is None:
+            return 0
+        capacity, rate = rule
+        try:
+            wait = self.backend.take(client_key(route, ip, token), capacity, rate)
+        except Exception as e:
+            # A broken shared backend must not take the gate down with it
+            log_event(log, logging.WARNING, 'rate limit backend error', error=str(e))
+            return 0
+        if wait > 0:
+            metrics.inc('rate_limited_total', {'route': route, 'reason': 'client'})
+        return wait
+
+
+class AdmissionGate:
+    """Cap the number of requests doing database work at the same time
+
+    Requests over the cap are rejected straight away rather than queued, so
+    a burst turns into quick 429s instead of every request timing out.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = admission_limit(WEB_THREADS) if limit is None else limit
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def try_enter(self):
+        if self.limit <= 0:
+            return True
+        with self._lock:
+            if self._in_flight >= self.limit:
+                return False
+            self._in_flight += 1
+            metrics.set_gauge('admission_in_flight', self._in_flight)
+            return True
+
+    def leave(self):
+        if self.limit <= 0:
+            return
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            metrics.set_gauge('admission_in_flight', self._in_flight)
+
+
+metrics.describe('rate_limited_total', 'counter', 'Requests rejected with 429 by route and reason')
+metrics.describe('admission_in_flight', 'gauge', 'Requests currently admitted past the admission gate')
+
+rate_limiter = RateLimiter()
+admission = AdmissionGate()
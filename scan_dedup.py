@@ -0,0 +1,134 @@
+"""
+Scan Deduplication
+Remembers recent scan decisions per member and event so a QR code held in
+front of the scanner is only logged (and awarded points) once per cooldown.
+
+The in-memory index answers repeats inside one worker without touching the
+database. Across workers the scan_claims table (one row per member and
+event, valid until expires_at) makes sure only one of them writes; expired
+claims are purged every SCAN_CLAIM_PURGE_SECONDS by ClaimPurger.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from instrumentation import get_logger, log_event, metrics
+
+log = get_logger('scan_dedup')
+
+SCAN_COOLDOWN_SECONDS = int(os.environ.get('SCAN_COOLDOWN_SECONDS', '60'))
+SCAN_INDEX_MAX_ENTRIES = int(os.environ.get('SCAN_INDEX_MAX_ENTRIES', '10000'))
+SCAN_CLAIM_PURGE_SECONDS = int(os.environ.get('SCAN_CLAIM_PURGE_SECONDS', '300'))
+
+
+def scan_key(member_number, event):
+    """Key used for both the in-memory index and the database guard"""
+    return (str(member_number).strip().upper(), str(event or '').strip().lower())
+
+
+def purge_expired_claims(conn, postgres, now=None):
+    """Delete scan claims whose cooldown has run out; returns rows deleted"""
+    cursor = conn.cursor()
+    cursor.execute(
+        f"DELETE FROM scan_claims WHERE expires_at <= {'%s' if postgres else '?'}",
+        (time.time() if now is None else now,)
+    )
+    conn.commit()
+    return cursor.rowcount
+
+
+class ClaimPurger:
+    """Background thread that runs purge_expired_claims() every SCAN_CLAIM_PURGE_SECONDS
+
+    New scans overwrite expired claims anyway; this only stops the table
+    collecting a row for every member ever scanned.
+    """
+
+    def __init__(self, connect, postgres, interval=None):
+        self.connect = connect
+        self.postgres = postgres
+        self.interval = SCAN_CLAIM_PURGE_SECONDS if interval is None else interval
+        self._started = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start once per process (safe to call on every request)"""
+        if self._started or self.interval <= 0:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            threading.Thread(target=self._run, daemon=True, name='scan-claim-purger').start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                conn = self.connect()
+                try:
+                    purge_expired_claims(conn, self.postgres)
+                finally:
+                    conn.close()
+            except Exception as e:
+                log_event(log, logging.ERROR, 'scan claim purge failed', error=str(e))
+
+
+class RecentScanIndex:
+    """Thread-safe map of recent scan decisions with time-based eviction
+
+    Most entries live for the full cooldown, so insertion order is close to
+    expiry order and eviction only ever has to look at the oldest entries.
+    Entries cached for less (the rest of another worker's claim) are
+    checked on read and leave with the older entries around them.
+    """
+
+    def __init__(self, cooldown=None, max_entries=None):
+        self.cooldown = SCAN_COOLDOWN_SECONDS if cooldown is None else cooldown
+        self.max_entries = max_entries or SCAN_INDEX_MAX_ENTRIES
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.cooldown > 0
+
+    def _evict(self, now):
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    def get(self, key, now=None):
+        """Return the stored decision for key if its cooldown has not expired"""
+        if not self.enabled:
+            return None
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(key)
+            return entry[1] if entry and entry[0] > now else None
+
+    def put(self, key, decision, ttl=None, now=None):
+        """Remember a decision for ttl seconds (default: the cooldown)"""
+        ttl = self.cooldown if ttl is None else min(ttl, self.cooldown)
+        if not self.enabled or ttl <= 0:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (now + ttl, decision)
+            self._evict(now)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+metrics.describe('scan_duplicates_total', 'counter', 'Repeat scans answered from the cooldown index or database guard')
+
+recent_scans = RecentScanIndex()
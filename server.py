@@ -1,15 +1,54 @@
 import time
-print("🚀 Application starting...")
 time.sleep(2)  # Give time for environment to load
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, g, Response, has_request_context
 from flask_cors import CORS
 import hashlib
+import logging
 import secrets
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 
+# Load environment variables
+load_dotenv()
+
+from instrumentation import (
+    get_logger, log_event, metrics, timed_connect,
+    try_start_profile, finish_profile, PROFILING_ENABLED
+)
+import instrumentation
+from scan_dedup import recent_scans, scan_key, ClaimPurger
+from rate_limit import rate_limiter, admission, admission_limit, ADMISSION_EXEMPT_ROUTES, WEB_THREADS
+from events import event_directory, event_counters, scan_broadcaster, SSE_MAX_CLIENTS
+from db_routing import read_only, recent_writes, replica_backoff, DATABASE_REPLICA_URL, REPLICA_CONNECT_TIMEOUT
+import points_ledger
+from spreadsheet_import import (
+    read_upload, load_column_map, chunked, ImportReport, IMPORT_MAX_UPLOAD_MB
+)
+
+log = get_logger('server')
+log.info('Application starting')
+
+app = Flask(__name__, static_folder='static')
+CORS(app)
+# Also stops uploads sent without a Content-Length before they are spooled
+app.config['MAX_CONTENT_LENGTH'] = int(IMPORT_MAX_UPLOAD_MB * 1024 * 1024)
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'error': f'File too large (limit {IMPORT_MAX_UPLOAD_MB:g} MB)'}), 413
+
+# Render terminates TLS in a proxy; trust its X-Forwarded-For so
+# request.remote_addr is the real client (used for rate limiting)
+if 'RENDER' in os.environ:
+    from werkzeug.middleware.proxy_fix import ProxyFix
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+
+# Live dashboard streams hold their threads outside the admission gate,
+# so the gate only gets what is left once they are all open
+admission.limit = admission_limit(WEB_THREADS - SSE_MAX_CLIENTS)
+
 @app.route('/health')
 def health():
     return 'OK', 200
@@ -24,18 +63,122 @@ def show_env():
         'is_render': 'RENDER' in os.environ,
         'timestamp': datetime.now().isoformat()
     }
+
+# ============= INSTRUMENTATION =============
+
+@app.before_request
+def start_request_timer():
+    """Start timing the request and, if requested, profile it"""
+    g.request_start = time.perf_counter()
+    g.profiler = None
+    metrics.add_gauge('http_requests_in_flight', 1)
+    if PROFILING_ENABLED and request.headers.get('X-Profile') == '1':
+        g.profiler = try_start_profile()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record route latency and status once the response is ready"""
+    start = g.pop('request_start', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.observe('http_request_duration_seconds', elapsed,
+                    {'route': route, 'method': request.method})
+    metrics.inc('http_requests_total',
+                {'route': route, 'method': request.method, 'status': response.status_code})
+    metrics.add_gauge('http_requests_in_flight', -1)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        finish_profile(profiler, route, elapsed)
+    log_event(log, logging.DEBUG, 'request', route=route, method=request.method,
+              status=response.status_code, ms=round(elapsed * 1000, 2))
+    return response
+
+# ============= READ/WRITE ROUTING =============
+
+@app.before_request
+def choose_db_route():
+    """Let @read_only routes read from the replica unless this session just wrote"""
+    view = app.view_functions.get(request.endpoint)
+    g.read_only = getattr(view, 'read_only', False) and not recent_writes.recent(session_key())
+
+@app.after_request
+def remember_writes(response):
+    """Keep a session on the primary for a short while after it changes data"""
+    if request.method != 'GET' and response.status_code < 400 and not g.get('read_only'):
+        recent_writes.mark(session_key())
+    return response
+
+# ============= RATE LIMITING =============
+
+@app.before_request
+def enforce_rate_limits():
+    """Reject with 429 when a client is over its limit or the server is saturated"""
+    route = request.url_rule.rule if request.url_rule else None
+    if not route or not route.startswith('/api/'):
+        return None
     
-# Load environment variables
-load_dotenv()
+    wait = rate_limiter.check(route, request.remote_addr, request.headers.get('Authorization'))
+    if wait > 0:
+        response = jsonify({'error': 'Too many requests - please slow down'})
+        response.headers['Retry-After'] = str(max(1, int(wait + 0.999)))
+        return response, 429
+    
+    if route in ADMISSION_EXEMPT_ROUTES:
+        return None
+    
+    if not admission.try_enter():
+        metrics.inc('rate_limited_total', {'route': route, 'reason': 'overloaded'})
+        response = jsonify({'error': 'Server busy - please try again'})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+    g.admitted = True
+    return None
 
-app = Flask(__name__, static_folder='static')
-CORS(app)
+@app.teardown_request
+def release_request_state(exc):
+    """Free the admission slot, and balance the in-flight gauge and profiler
+    slot when a request errors out"""
+    if g.pop('admitted', False):
+        admission.leave()
+    if g.pop('request_start', None) is not None:
+        metrics.add_gauge('http_requests_in_flight', -1)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        finish_profile(profiler, request.path, 0.0)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus-style metrics for this worker process"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profile')
+def last_request_profile():
+    """Folded stacks of the most recently profiled request (PROFILING_ENABLED only)"""
+    if not PROFILING_ENABLED:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    if instrumentation.last_profile is None:
+        return jsonify({'error': 'No request has been profiled yet'}), 404
+    return jsonify(instrumentation.last_profile)
 
 # Determine if we're in production (Render)
 IS_RENDER = 'RENDER' in os.environ
 
-def get_db():
-    """Get database connection - works with SQLite (local) and PostgreSQL (Render)"""
+def session_key():
+    """Identifies the caller for read-your-writes tracking"""
+    return request.headers.get('Authorization') or request.args.get('token') or request.remote_addr
+
+def get_db(readonly=None):
+    """Get database connection - works with SQLite (local) and PostgreSQL (Render)
+    
+    readonly=None follows the route: @read_only routes get a read-only
+    connection (the replica, if configured) unless this session wrote
+    recently. Pass True or False to choose explicitly.
+    """
+    if readonly is None:
+        readonly = has_request_context() and g.get('read_only', False)
+    
     db_url = os.environ.get('DATABASE_URL')
     
     if db_url:
@@ -47,21 +190,40 @@ def get_db():
         if db_url.startswith('postgres://'):
             db_url = db_url.replace('postgres://', 'postgresql://', 1)
         
+        if readonly and DATABASE_REPLICA_URL and replica_backoff.available():
+            replica_url = DATABASE_REPLICA_URL.replace('postgres://', 'postgresql://', 1)
+            try:
+                conn = timed_connect('postgresql-replica', psycopg2.connect, replica_url,
+                                     cursor_factory=DictCursor, connect_timeout=REPLICA_CONNECT_TIMEOUT)
+                conn.set_session(readonly=True)
+                metrics.inc('db_route_total', {'target': 'replica'})
+                return conn
+            except Exception as e:
+                replica_backoff.failed()
+                log_event(log, logging.WARNING, 'replica connect failed, using primary',
+                          error=str(e), retry_in=replica_backoff.seconds)
+        
         try:
-            conn = psycopg2.connect(db_url, cursor_factory=DictCursor)
-            print("✅ Connected to PostgreSQL on Render")
+            conn = timed_connect('postgresql', psycopg2.connect, db_url, cursor_factory=DictCursor)
+            log_event(log, logging.DEBUG, 'db connected', backend='postgresql')
+            metrics.inc('db_route_total', {'target': 'primary'})
             return conn
         except Exception as e:
-            print(f"❌ PostgreSQL connection failed: {e}")
-            print("Falling back to SQLite...")
+            log_event(log, logging.ERROR, 'db connect failed, falling back to sqlite',
+                      backend='postgresql', error=str(e))
             # Continue to SQLite fallback
     
     # SQLite (Local Development)
     import sqlite3
     DATABASE = 'membership.db'
-    conn = sqlite3.connect(DATABASE)
+    if readonly and os.path.exists(DATABASE):
+        conn = timed_connect('sqlite-readonly', sqlite3.connect, f'file:{DATABASE}?mode=ro', uri=True)
+        metrics.inc('db_route_total', {'target': 'readonly'})
+    else:
+        conn = timed_connect('sqlite', sqlite3.connect, DATABASE)
+        metrics.inc('db_route_total', {'target': 'primary'})
     conn.row_factory = sqlite3.Row
-    print("✅ Connected to SQLite (local development)")
+    log_event(log, logging.DEBUG, 'db connected', backend='sqlite')
     return conn
 
 def init_db():
@@ -73,7 +235,7 @@ def init_db():
     try:
         cursor.execute("SELECT sqlite_version()")
         db_type = "SQLite"
-        print("📊 Initializing SQLite database...")
+        log.info('Initializing SQLite database')
         
         # SQLite table definitions
         cursor.execute('''
@@ -130,9 +292,57 @@ def init_db():
             )
         ''')
         
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT UNIQUE NOT NULL,
+                capacity INTEGER,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Older databases have attendance without event_id
+        cursor.execute('PRAGMA table_info(attendance)')
+        if 'event_id' not in [column[1] for column in cursor.fetchall()]:
+            cursor.execute('ALTER TABLE attendance ADD COLUMN event_id INTEGER REFERENCES events (id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_event ON attendance(event_id, status)')
+        
+        # Append-only points history; members.points is materialized from it
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS points_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                member_id INTEGER NOT NULL,
+                member_number TEXT,
+                points INTEGER NOT NULL,
+                reason TEXT NOT NULL,
+                materialized INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (member_id) REFERENCES members (id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_points_ledger_member ON points_ledger(member_id, materialized)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_points_ledger_pending ON points_ledger(id) WHERE materialized = 0')
+        
+        # One row per member and event while its cooldown runs - guards
+        # against duplicate scans handled by different workers
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_claims (
+                member_number TEXT NOT NULL,
+                event_key TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                member_name TEXT NOT NULL,
+                status TEXT NOT NULL,
+                points_awarded INTEGER NOT NULL,
+                PRIMARY KEY (member_number, event_key)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_scan_claims_expires ON scan_claims(expires_at)')
+        
     except:
+        # The failed sqlite_version() probe aborts the PostgreSQL transaction
+        conn.rollback()
         db_type = "PostgreSQL"
-        print("📊 Initializing PostgreSQL database...")
+        log.info('Initializing PostgreSQL database')
         
         # PostgreSQL table definitions
         cursor.execute('''
@@ -189,15 +399,82 @@ def init_db():
             )
         ''')
         
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS events (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(100) UNIQUE NOT NULL,
+                capacity INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('ALTER TABLE attendance ADD COLUMN IF NOT EXISTS event_id INTEGER REFERENCES events (id)')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS points_ledger (
+                id BIGSERIAL PRIMARY KEY,
+                member_id INTEGER NOT NULL REFERENCES members (id),
+                member_number VARCHAR(50),
+                points INTEGER NOT NULL,
+                reason VARCHAR(50) NOT NULL,
+                materialized INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_claims (
+                member_number VARCHAR(50) NOT NULL,
+                event_key VARCHAR(100) NOT NULL,
+                expires_at DOUBLE PRECISION NOT NULL,
+                member_name VARCHAR(200) NOT NULL,
+                status VARCHAR(20) NOT NULL,
+                points_awarded INTEGER NOT NULL,
+                PRIMARY KEY (member_number, event_key)
+            )
+        ''')
+        
         # Create indexes for PostgreSQL
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_token ON sessions(token)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_members_email ON members(email)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_member ON attendance(member_number)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_timestamp ON attendance(timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_event ON attendance(event_id, status)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_points_ledger_member ON points_ledger(member_id, materialized)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_points_ledger_pending ON points_ledger(id) WHERE materialized = 0')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_scan_claims_expires ON scan_claims(expires_at)')
+    
+    # Scans from before events existed are linked to the event they name
+    cursor.execute('''
+        INSERT INTO events (name)
+        SELECT DISTINCT COALESCE(NULLIF(event_name, ''), 'General Access') FROM attendance
+        WHERE event_id IS NULL
+        ON CONFLICT (name) DO NOTHING
+    ''')
+    cursor.execute('''
+        UPDATE attendance SET event_id = (
+            SELECT id FROM events WHERE name = COALESCE(NULLIF(attendance.event_name, ''), 'General Access')
+        )
+        WHERE event_id IS NULL
+    ''')
+    
+    # Balances from before the ledger existed become opening entries. Every
+    # worker runs this at startup; the unique index keeps it to one per member.
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_points_ledger_opening
+        ON points_ledger(member_id) WHERE reason = 'opening balance'
+    ''')
+    cursor.execute('''
+        INSERT INTO points_ledger (member_id, member_number, points, reason, materialized)
+        SELECT id, member_number, points, 'opening balance', 1 FROM members
+        WHERE COALESCE(points, 0) <> 0
+        AND NOT EXISTS (SELECT 1 FROM points_ledger WHERE points_ledger.member_id = members.id)
+        ON CONFLICT (member_id) WHERE reason = 'opening balance' DO NOTHING
+    ''')
     
     conn.commit()
     conn.close()
-    print(f"✅ {db_type} database initialized successfully!")
+    log_event(log, logging.INFO, 'database initialized', backend=db_type)
 
 def hash_password(password):
     """Hash password using SHA256"""
@@ -207,9 +484,8 @@ def generate_token():
     """Generate secure random token"""
     return secrets.token_urlsafe(32)
 
-def verify_token(token):
-    """Verify if token is valid and return user info"""
-    conn = get_db()
+def find_session(conn, token):
+    """Look up a session token on the given connection - user info or None"""
     cursor = conn.cursor()
     
     # Use correct parameter style
@@ -237,13 +513,31 @@ def verify_token(token):
         }
     return None
 
+def verify_token(token):
+    """Verify if token is valid and return user info
+    
+    Read-your-writes is tracked per worker, so a session created moments
+    ago on another worker may not have reached the replica yet. A miss on
+    a read-only route is checked again on the primary, and if the session
+    is there the rest of the request reads from the primary too.
+    """
+    user = find_session(get_db(), token)
+    
+    if user is None and token and has_request_context() and g.get('read_only'):
+        user = find_session(get_db(readonly=False), token)
+        if user:
+            metrics.inc('replica_session_miss_total')
+            g.read_only = False
+            recent_writes.mark(session_key())
+    
+    return user
+
 # Initialize database on startup (but handle errors)
 try:
     init_db()
-    print("✅ Database initialized successfully!")
 except Exception as e:
-    print(f"⚠️  Database initialization warning: {e}")
-    print("Continuing... tables may already exist.")
+    log_event(log, logging.WARNING, 'database initialization warning, tables may already exist',
+              error=str(e))
 
 # ============= API ROUTES =============
 
@@ -252,6 +546,112 @@ def index():
     """Serve the main HTML file"""
     return send_from_directory('static', 'index.html')
 
+# Column order of the values returned by member_values()
+MEMBER_IMPORT_COLUMNS = (
+    'member_number', 'first_name', 'surname', 'email', 'phone', 'password_hash',
+    'membership_type', 'expiry_date', 'status', 'photo_url', 'is_admin'
+)
+
+def prepare_member(member_data):
+    """Clean one imported member record - raises ValueError if it can't be imported"""
+    email = member_data.get('email', '').strip().lower()
+    member_number = member_data.get('member_number', '').strip()
+    
+    if not email or not member_number:
+        raise ValueError(f"Missing email or member number for {member_data}")
+    
+    # Default password is the member's email
+    return {
+        'member_number': member_number,
+        'first_name': member_data.get('first_name', '').strip(),
+        'surname': member_data.get('surname', '').strip(),
+        'email': email,
+        'phone': member_data.get('phone', '').strip(),
+        'password_hash': hash_password(email),
+        'membership_type': member_data.get('membership_type', 'Solo'),
+        'expiry_date': member_data.get('expiry_date', ''),
+        'status': member_data.get('status', 'active'),
+        'photo_url': member_data.get('photo_url', 'https://ui-avatars.com/api/?name=' + member_data.get('first_name', 'U') + '+' + member_data.get('surname', 'U')),
+        'is_admin': 1 if str(member_data.get('is_admin', '')).lower() in ['yes', 'true', '1', 'admin'] else 0,
+        'family_members': member_data.get('family_members') or []
+    }
+
+def member_values(member):
+    """Parameters for the members INSERT, in MEMBER_IMPORT_COLUMNS order"""
+    return tuple(member[column] for column in MEMBER_IMPORT_COLUMNS)
+
+def save_member(cursor, member):
+    """Insert or update one prepared member and their family members"""
+    email = member['email']
+
+    # Use correct SQL for database type
+    if IS_RENDER:
+        # PostgreSQL
+        cursor.execute('''
+            INSERT INTO members 
+            (member_number, first_name, surname, email, phone, password_hash, 
+             membership_type, expiry_date, status, photo_url, points, is_admin)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 0, %s)
+            ON CONFLICT (email) 
+            DO UPDATE SET
+                member_number = EXCLUDED.member_number,
+                first_name = EXCLUDED.first_name,
+                surname = EXCLUDED.surname,
+                phone = EXCLUDED.phone,
+                membership_type = EXCLUDED.membership_type,
+                expiry_date = EXCLUDED.expiry_date,
+                status = EXCLUDED.status,
+                photo_url = EXCLUDED.photo_url,
+                is_admin = EXCLUDED.is_admin
+        ''', member_values(member))
+    else:
+        # SQLite
+        # Upsert rather than REPLACE so the member keeps its id (and
+        # with it its points ledger and family members)
+        cursor.execute('''
+            INSERT INTO members 
+            (member_number, first_name, surname, email, phone, password_hash, 
+             membership_type, expiry_date, status, photo_url, points, is_admin)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
+            ON CONFLICT (email) 
+            DO UPDATE SET
+                member_number = excluded.member_number,
+                first_name = excluded.first_name,
+                surname = excluded.surname,
+                phone = excluded.phone,
+                membership_type = excluded.membership_type,
+                expiry_date = excluded.expiry_date,
+                status = excluded.status,
+                photo_url = excluded.photo_url,
+                is_admin = excluded.is_admin
+        ''', member_values(member))
+    
+    # Get member ID
+    query = 'SELECT id FROM members WHERE email = %s' if IS_RENDER else 'SELECT id FROM members WHERE email = ?'
+    cursor.execute(query, (email,))
+    result = cursor.fetchone()
+    member_id = result[0] if result else None
+    
+    # Insert family members
+    if member['family_members'] and member_id:
+        for fm in member['family_members']:
+            if IS_RENDER:
+                cursor.execute('''
+                    INSERT INTO family_members 
+                    (primary_member_id, member_number, name, relationship)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (member_number) 
+                    DO UPDATE SET
+                        name = EXCLUDED.name,
+                        relationship = EXCLUDED.relationship
+                ''', (member_id, fm['member_number'], fm['name'], fm['relationship']))
+            else:
+                cursor.execute('''
+                    INSERT OR REPLACE INTO family_members 
+                    (primary_member_id, member_number, name, relationship)
+                    VALUES (?, ?, ?, ?)
+                ''', (member_id, fm['member_number'], fm['name'], fm['relationship']))
+
 @app.route('/api/import-excel', methods=['POST'])
 def import_excel():
     """Import members from Excel file (Admin only)"""
@@ -270,97 +670,12 @@ def import_excel():
     
     for member_data in data:
         try:
-            email = member_data.get('email', '').strip().lower()
-            member_number = member_data.get('member_number', '').strip()
-            
-            if not email or not member_number:
-                errors.append(f"Missing email or member number for {member_data}")
+            try:
+                member = prepare_member(member_data)
+            except ValueError as e:
+                errors.append(str(e))
                 continue
-            
-            default_password = email
-            password_hash = hash_password(default_password)
-            
-            is_admin = 1 if str(member_data.get('is_admin', '')).lower() in ['yes', 'true', '1', 'admin'] else 0
-            
-            # Use correct SQL for database type
-            if IS_RENDER:
-                # PostgreSQL
-                cursor.execute('''
-                    INSERT INTO members 
-                    (member_number, first_name, surname, email, phone, password_hash, 
-                     membership_type, expiry_date, status, photo_url, points, is_admin)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 0, %s)
-                    ON CONFLICT (email) 
-                    DO UPDATE SET
-                        member_number = EXCLUDED.member_number,
-                        first_name = EXCLUDED.first_name,
-                        surname = EXCLUDED.surname,
-                        phone = EXCLUDED.phone,
-                        membership_type = EXCLUDED.membership_type,
-                        expiry_date = EXCLUDED.expiry_date,
-                        status = EXCLUDED.status,
-                        photo_url = EXCLUDED.photo_url,
-                        is_admin = EXCLUDED.is_admin
-                ''', (
-                    member_number,
-                    member_data.get('first_name', '').strip(),
-                    member_data.get('surname', '').strip(),
-                    email,
-                    member_data.get('phone', '').strip(),
-                    password_hash,
-                    member_data.get('membership_type', 'Solo'),
-                    member_data.get('expiry_date', ''),
-                    member_data.get('status', 'active'),
-                    member_data.get('photo_url', 'https://ui-avatars.com/api/?name=' + member_data.get('first_name', 'U') + '+' + member_data.get('surname', 'U')),
-                    is_admin
-                ))
-            else:
-                # SQLite
-                cursor.execute('''
-                    INSERT OR REPLACE INTO members 
-                    (member_number, first_name, surname, email, phone, password_hash, 
-                     membership_type, expiry_date, status, photo_url, points, is_admin)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
-                ''', (
-                    member_number,
-                    member_data.get('first_name', '').strip(),
-                    member_data.get('surname', '').strip(),
-                    email,
-                    member_data.get('phone', '').strip(),
-                    password_hash,
-                    member_data.get('membership_type', 'Solo'),
-                    member_data.get('expiry_date', ''),
-                    member_data.get('status', 'active'),
-                    member_data.get('photo_url', 'https://ui-avatars.com/api/?name=' + member_data.get('first_name', 'U') + '+' + member_data.get('surname', 'U')),
-                    is_admin
-                ))
-            
-            # Get member ID
-            query = 'SELECT id FROM members WHERE email = %s' if IS_RENDER else 'SELECT id FROM members WHERE email = ?'
-            cursor.execute(query, (email,))
-            result = cursor.fetchone()
-            member_id = result[0] if result else None
-            
-            # Insert family members
-            if 'family_members' in member_data and member_data['family_members'] and member_id:
-                for fm in member_data['family_members']:
-                    if IS_RENDER:
-                        cursor.execute('''
-                            INSERT INTO family_members 
-                            (primary_member_id, member_number, name, relationship)
-                            VALUES (%s, %s, %s, %s)
-                            ON CONFLICT (member_number) 
-                            DO UPDATE SET
-                                name = EXCLUDED.name,
-                                relationship = EXCLUDED.relationship
-                        ''', (member_id, fm['member_number'], fm['name'], fm['relationship']))
-                    else:
-                        cursor.execute('''
-                            INSERT OR REPLACE INTO family_members 
-                            (primary_member_id, member_number, name, relationship)
-                            VALUES (?, ?, ?, ?)
-                        ''', (member_id, fm['member_number'], fm['name'], fm['relationship']))
-            
+            save_member(cursor, member)
             imported += 1
             
         except Exception as e:
@@ -375,6 +690,77 @@ def import_excel():
         'errors': errors
     })
 
+@app.route('/api/import-file', methods=['POST'])
+def import_file():
+    """Import members from an uploaded .xlsx or .csv file (Admin only)
+    
+    Multipart form: file, plus optional mapping (JSON column mapping) and
+    sheets (comma-separated sheet names). Rows are read and saved in
+    chunks, each chunk in its own transaction.
+    """
+    token = request.headers.get('Authorization')
+    user = verify_token(token)
+    
+    if not user or user['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 401
+    
+    if request.content_length and request.content_length > IMPORT_MAX_UPLOAD_MB * 1024 * 1024:
+        return jsonify({'error': f'File too large (limit {IMPORT_MAX_UPLOAD_MB:g} MB)'}), 413
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'No file uploaded'}), 400
+    
+    try:
+        column_map = load_column_map(request.form.get('mapping'))
+        sheets = [name.strip() for name in request.form.get('sheets', '').split(',') if name.strip()]
+        rows = read_upload(upload.stream, upload.filename, column_map, sheets)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    report = ImportReport()
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    try:
+        for chunk in chunked(rows):
+            if not IS_RENDER:
+                # Outside a transaction SQLite commits every RELEASE SAVEPOINT;
+                # open one so the chunk commits once
+                cursor.execute('BEGIN IMMEDIATE')
+            saved = []
+            for sheet, row_number, member_data in chunk:
+                if isinstance(member_data, ValueError):
+                    report.error(sheet, row_number, str(member_data), getattr(member_data, 'member_number', None))
+                    continue
+                try:
+                    member = prepare_member(member_data)
+                    # A bad row only rolls back itself, not the rest of the chunk
+                    cursor.execute('SAVEPOINT import_row')
+                    try:
+                        save_member(cursor, member)
+                    except Exception:
+                        cursor.execute('ROLLBACK TO SAVEPOINT import_row')
+                        raise
+                    cursor.execute('RELEASE SAVEPOINT import_row')
+                    saved.append(sheet)
+                except Exception as e:
+                    report.error(sheet, row_number, str(e), member_data.get('member_number'))
+            conn.commit()
+            for sheet in saved:
+                report.ok(sheet)
+    except Exception as e:
+        # The file broke part-way through; earlier chunks stay imported
+        conn.rollback()
+        log_event(log, logging.WARNING, 'import file failed', filename=upload.filename, error=str(e))
+        return jsonify({'success': False, 'error': f'Could not read file: {e}', **report.as_dict()}), 400
+    finally:
+        conn.close()
+    
+    log_event(log, logging.INFO, 'import file done', filename=upload.filename,
+              imported=report.imported, errors=report.error_count)
+    return jsonify({'success': True, **report.as_dict()})
+
 @app.route('/api/login', methods=['POST'])
 def login():
     """Login endpoint - email-based authentication"""
@@ -400,10 +786,14 @@ def login():
         
         insert_query = 'INSERT INTO sessions (email, token, role, expires_at) VALUES (%s, %s, %s, %s)' if IS_RENDER else 'INSERT INTO sessions (email, token, role, expires_at) VALUES (?, ?, ?, ?)'
         cursor.execute(insert_query, (email, token, role, expires_at))
+        points = points_ledger.balance(cursor, IS_RENDER, member['id'])
         
         conn.commit()
         conn.close()
         
+        # The new session's first reads must see its own sessions row
+        recent_writes.mark(token)
+        
         return jsonify({
             'success': True,
             'token': token,
@@ -415,7 +805,7 @@ def login():
                 'email': member['email'],
                 'membership_type': member['membership_type'],
                 'status': member['status'],
-                'points': member['points'],
+                'points': points,
                 'is_admin': member['is_admin']
             }
         })
@@ -427,6 +817,7 @@ def login():
 # Just make sure they use the parameter style checks like above
 
 @app.route('/api/member/profile', methods=['GET'])
+@read_only
 def get_member_profile():
     """Get member profile and attendance"""
     token = request.headers.get('Authorization')
@@ -478,14 +869,28 @@ def get_member_profile():
     cursor.execute(query, (member['member_number'], user['email']))
     attendance = [dict(row) for row in cursor.fetchall()]
     
+    # Balance = materialized points + ledger entries not yet folded in
+    member = dict(member)
+    member['points'] = points_ledger.balance(cursor, IS_RENDER, member['id'])
+    
     conn.close()
     
     return jsonify({
-        'member': dict(member),
+        'member': member,
         'family_members': family_members,
         'attendance': attendance
     })
 
+def scan_decision(member_name, status, points_awarded):
+    """Response body for a scan - also what repeat scans are answered with"""
+    return {
+        'success': True,
+        'status': status,
+        'member_name': member_name,
+        'points_awarded': points_awarded,
+        'message': 'Access Granted' if status == 'granted' else 'Membership Expired'
+    }
+
 @app.route('/api/scan', methods=['POST'])
 def scan_qr():
     """Handle QR code scanning (Admin only)"""
@@ -497,7 +902,23 @@ def scan_qr():
     
     data = request.json
     scanned_member_number = data.get('member_number')
+    
+    # Scans name their event (created on first use) or pass its id
+    event_id = data.get('event_id')
     event_name = data.get('event_name', 'General Access')
+    if event_id is not None and not str(event_id).isdigit():
+        return jsonify({'error': 'Invalid event id'}), 400
+    event = event_directory.get(event_id, event_name) or resolve_event(event_id, event_name)
+    if not event:
+        return jsonify({'error': 'Event not found'}), 404
+    event_id, event_name = event
+    
+    # Repeat scans inside the cooldown get the earlier decision, no writes
+    dedup_key = scan_key(scanned_member_number, event_id)
+    previous = recent_scans.get(dedup_key)
+    if previous:
+        metrics.inc('scan_duplicates_total', {'source': 'memory'})
+        return jsonify(dict(previous, duplicate=True))
     
     conn = get_db()
     cursor = conn.cursor()
@@ -554,53 +975,291 @@ def scan_qr():
     
     # Award points if active
     points_awarded = 10 if is_active else 0
+    status = 'granted' if is_active else 'denied'
+    
+    # Claim this member/event for the cooldown; another worker may
+    # already hold an unexpired claim
+    if recent_scans.enabled:
+        now = time.time()
+        claim_query = '''
+            INSERT INTO scan_claims
+            (member_number, event_key, expires_at, member_name, status, points_awarded)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (member_number, event_key) DO UPDATE SET
+                expires_at = EXCLUDED.expires_at,
+                member_name = EXCLUDED.member_name,
+                status = EXCLUDED.status,
+                points_awarded = EXCLUDED.points_awarded
+            WHERE scan_claims.expires_at <= %s
+        ''' if IS_RENDER else '''
+            INSERT INTO scan_claims
+            (member_number, event_key, expires_at, member_name, status, points_awarded)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (member_number, event_key) DO UPDATE SET
+                expires_at = excluded.expires_at,
+                member_name = excluded.member_name,
+                status = excluded.status,
+                points_awarded = excluded.points_awarded
+            WHERE scan_claims.expires_at <= ?
+        '''
+        cursor.execute(claim_query, dedup_key + (now + recent_scans.cooldown, member_name, status, points_awarded, now))
+        
+        if cursor.rowcount == 0:
+            query = '''
+                SELECT member_name, status, points_awarded, expires_at FROM scan_claims
+                WHERE member_number = %s AND event_key = %s
+            ''' if IS_RENDER else '''
+                SELECT member_name, status, points_awarded, expires_at FROM scan_claims
+                WHERE member_number = ? AND event_key = ?
+            '''
+            cursor.execute(query, dedup_key)
+            earlier = cursor.fetchone()
+            conn.rollback()
+            conn.close()
+            
+            decision = scan_decision(member_name, status, points_awarded)
+            if earlier:
+                decision = scan_decision(earlier[0], earlier[1], earlier[2])
+                # Only for what is left of the other worker's claim
+                recent_scans.put(dedup_key, decision, ttl=earlier[3] - now)
+            metrics.inc('scan_duplicates_total', {'source': 'database'})
+            return jsonify(dict(decision, duplicate=True))
     
     # Log attendance
+    scanned_at = datetime.now().isoformat()
     insert_query = '''
         INSERT INTO attendance 
-        (member_number, member_name, event_name, scanned_by, timestamp, points_awarded, status)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        (member_number, member_name, event_id, event_name, scanned_by, timestamp, points_awarded, status)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
     ''' if IS_RENDER else '''
         INSERT INTO attendance 
-        (member_number, member_name, event_name, scanned_by, timestamp, points_awarded, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
+        (member_number, member_name, event_id, event_name, scanned_by, timestamp, points_awarded, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
     '''
     cursor.execute(insert_query, (
         scanned_member_number,
         member_name,
+        event_id,
         event_name,
         user['email'],
-        datetime.now().isoformat(),
+        scanned_at,
         points_awarded,
-        'granted' if is_active else 'denied'
+        status
     ))
     
-    # Update member points if active (only for primary member)
+    # Award points to the primary member (family scans included) - an
+    # append, so concurrent family scans don't wait on the member row
     if is_active:
-        update_query = '''
-            UPDATE members 
-            SET points = points + %s 
-            WHERE member_number = %s OR id = (
-                SELECT primary_member_id FROM family_members WHERE member_number = %s
-            )
-        ''' if IS_RENDER else '''
-            UPDATE members 
-            SET points = points + ? 
-            WHERE member_number = ? OR id = (
-                SELECT primary_member_id FROM family_members WHERE member_number = ?
-            )
-        '''
-        cursor.execute(update_query, (points_awarded, scanned_member_number, scanned_member_number))
+        points_ledger.append(cursor, IS_RENDER, member['id'], scanned_member_number, points_awarded, 'attendance')
     
     conn.commit()
     conn.close()
     
-    return jsonify({
-        'success': True,
-        'status': 'granted' if is_active else 'denied',
+    decision = scan_decision(member_name, status, points_awarded)
+    recent_scans.put(dedup_key, decision)
+    
+    # Update live counters and push the scan to open admin dashboards
+    counts = event_counters.record(event_id, scanned_member_number, status)
+    scan_broadcaster.publish({
+        'event_id': event_id,
+        'event_name': event_name,
+        'member_number': scanned_member_number,
         'member_name': member_name,
+        'scanned_by': user['email'],
+        'timestamp': scanned_at,
+        'status': status,
         'points_awarded': points_awarded,
-        'message': 'Access Granted' if is_active else 'Membership Expired'
+        'counts': counts
+    })
+    return jsonify(decision)
+
+# ============= EVENTS =============
+
+def resolve_event(event_id=None, name=None):
+    """Find an event by id, or by name (creating it) - returns (id, name) or None"""
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    if event_id is not None:
+        query = 'SELECT id, name FROM events WHERE id = %s' if IS_RENDER else 'SELECT id, name FROM events WHERE id = ?'
+        cursor.execute(query, (int(event_id),))
+    else:
+        name = (name or '').strip() or 'General Access'
+        insert_query = 'INSERT INTO events (name) VALUES (%s) ON CONFLICT (name) DO NOTHING' if IS_RENDER else 'INSERT OR IGNORE INTO events (name) VALUES (?)'
+        cursor.execute(insert_query, (name,))
+        query = 'SELECT id, name FROM events WHERE name = %s' if IS_RENDER else 'SELECT id, name FROM events WHERE name = ?'
+        cursor.execute(query, (name,))
+    
+    row = cursor.fetchone()
+    conn.commit()
+    conn.close()
+    
+    if not row:
+        return None
+    event_directory.add(row[0], row[1])
+    return row[0], row[1]
+
+def load_event_counts(event_id):
+    """Seed live counters for an event from the attendance table"""
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    query = '''
+        SELECT status, COUNT(*) FROM attendance WHERE event_id = %s GROUP BY status
+    ''' if IS_RENDER else '''
+        SELECT status, COUNT(*) FROM attendance WHERE event_id = ? GROUP BY status
+    '''
+    cursor.execute(query, (event_id,))
+    totals = {row[0]: row[1] for row in cursor.fetchall()}
+    
+    query = '''
+        SELECT DISTINCT member_number FROM attendance WHERE event_id = %s AND status = 'granted'
+    ''' if IS_RENDER else '''
+        SELECT DISTINCT member_number FROM attendance WHERE event_id = ? AND status = 'granted'
+    '''
+    cursor.execute(query, (event_id,))
+    attendees = {row[0] for row in cursor.fetchall()}
+    
+    conn.close()
+    return totals.get('granted', 0), totals.get('denied', 0), attendees
+
+event_counters.loader = load_event_counts
+
+def event_summary(row):
+    """Event row plus its live counters"""
+    summary = dict(row)
+    summary.update(event_counters.snapshot(row['id']))
+    return summary
+
+@app.route('/api/events', methods=['GET'])
+@read_only
+def list_events():
+    """Recent events with live attendance counters (Admin only)"""
+    user = verify_token(request.headers.get('Authorization'))
+    
+    if not user or user['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 401
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, name, capacity, created_at FROM events ORDER BY id DESC LIMIT 20')
+    rows = cursor.fetchall()
+    conn.close()
+    
+    for row in rows:
+        event_directory.add(row['id'], row['name'])
+    
+    return jsonify({'events': [event_summary(row) for row in rows]})
+
+@app.route('/api/events', methods=['POST'])
+def create_event():
+    """Create an event, optionally with a door capacity (Admin only)"""
+    user = verify_token(request.headers.get('Authorization'))
+    
+    if not user or user['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 401
+    
+    data = request.json
+    name = data.get('name', '').strip()
+    capacity = data.get('capacity')
+    
+    if not name:
+        return jsonify({'error': 'Event name required'}), 400
+    if capacity not in (None, '') and not str(capacity).isdigit():
+        return jsonify({'error': 'Capacity must be a whole number of people'}), 400
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    insert_query = '''
+        INSERT INTO events (name, capacity) VALUES (%s, %s)
+        ON CONFLICT (name) DO UPDATE SET capacity = EXCLUDED.capacity
+    ''' if IS_RENDER else '''
+        INSERT INTO events (name, capacity) VALUES (?, ?)
+        ON CONFLICT (name) DO UPDATE SET capacity = excluded.capacity
+    '''
+    cursor.execute(insert_query, (name, int(capacity) if capacity else None))
+    
+    query = 'SELECT id, name, capacity, created_at FROM events WHERE name = %s' if IS_RENDER else 'SELECT id, name, capacity, created_at FROM events WHERE name = ?'
+    cursor.execute(query, (name,))
+    row = cursor.fetchone()
+    
+    conn.commit()
+    conn.close()
+    
+    event_directory.add(row['id'], row['name'])
+    return jsonify({'success': True, 'event': event_summary(row)})
+
+@app.route('/api/events/<int:event_id>/stats', methods=['GET'])
+@read_only
+def event_stats(event_id):
+    """Live granted / denied / unique attendee counts for one event (Admin only)"""
+    user = verify_token(request.headers.get('Authorization'))
+    
+    if not user or user['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 401
+    
+    if not event_directory.get(event_id) and not resolve_event(event_id):
+        return jsonify({'error': 'Event not found'}), 404
+    
+    return jsonify(event_counters.snapshot(event_id))
+
+@app.route('/api/events/stream')
+@read_only
+def event_stream():
+    """Server-Sent Events feed of new scans (Admin only)
+
+    EventSource can't send headers, so the session token comes in ?token=.
+    """
+    user = verify_token(request.args.get('token'))
+    
+    if not user or user['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 401
+    
+    # Each open stream holds a worker thread until it ends
+    subscriber = scan_broadcaster.subscribe()
+    if subscriber is None:
+        return jsonify({'error': 'Too many live dashboards open - try again shortly'}), 503, {'Retry-After': '30'}
+    
+    return Response(
+        scan_broadcaster.stream(subscriber),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# ============= POINTS LEDGER =============
+
+points_materializer = points_ledger.Materializer(lambda: get_db(readonly=False), IS_RENDER)
+claim_purger = ClaimPurger(lambda: get_db(readonly=False), IS_RENDER)
+
+@app.before_request
+def start_points_materializer():
+    """Start the balance batch job and scan claim purge in this worker (after any gunicorn fork)"""
+    points_materializer.start()
+    claim_purger.start()
+
+@app.route('/api/admin/points/verify', methods=['POST'])
+def verify_points():
+    """Compare member balances with the points ledger, optionally repairing them (Admin only)"""
+    user = verify_token(request.headers.get('Authorization'))
+    
+    if not user or user['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 401
+    
+    repair = bool((request.get_json(silent=True) or {}).get('repair'))
+    conn = get_db(readonly=False)
+    try:
+        if repair:
+            mismatches = points_ledger.recompute(conn, IS_RENDER)
+        else:
+            mismatches = points_ledger.verify(conn, IS_RENDER)
+    finally:
+        conn.close()
+    
+    return jsonify({
+        'success': True,
+        'repaired': repair,
+        'mismatches': mismatches
     })
 
 # ... (CONTINUE WITH ALL OTHER ROUTES, ADJUSTING PARAMETER STYLE AS NEEDED)
@@ -618,5 +1277,5 @@ def test():
 if __name__ == '__main__':
     # For local development only
     port = int(os.environ.get('PORT', 5000))
-    print(f"🚀 Starting server on port {port}")
+    log_event(log, logging.INFO, 'starting development server', port=port)
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,713 @@
+"""
+Async Server (optional)
+Serves the busiest API routes from an ASGI app with async database drivers
+and a connection pool, so a few workers can handle many scanners and
+member app opens at once. The Flask app in server.py stays the default.
+
+Run with:
+    pip install -r requirements-async.txt
+    hypercorn server_async:app --bind 0.0.0.0:$PORT
+
+Shares table setup, rate limits, scan dedup and metrics with server.py.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+
+from quart import Quart, request, jsonify, send_from_directory, g, Response
+from quart_cors import cors
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from werkzeug.exceptions import HTTPException
+
+# Importing server creates the tables and gives us the shared helpers
+from server import (
+    app as flask_app, hash_password, generate_token, prepare_member, member_values,
+    scan_decision, points_materializer, claim_purger
+)
+from instrumentation import get_logger, log_event, metrics
+from scan_dedup import recent_scans, scan_key
+from points_ledger import BALANCE_QUERY
+from rate_limit import rate_limiter, admission, admission_limit, ADMISSION_EXEMPT_ROUTES
+from events import event_directory, event_counters, scan_broadcaster
+from spreadsheet_import import (
+    read_upload, load_column_map, chunked, ImportReport, IMPORT_MAX_UPLOAD_MB
+)
+
+log = get_logger('server_async')
+
+ASYNC_POOL_MIN = int(os.environ.get('ASYNC_POOL_MIN', '2'))
+ASYNC_POOL_MAX = int(os.environ.get('ASYNC_POOL_MAX', '10'))
+
+# Every admitted request holds one pooled connection, so shed load at the
+# pool size instead of letting requests queue for a connection
+admission.limit = admission_limit(ASYNC_POOL_MAX, reserve=0)
+DATABASE = 'membership.db'
+
+app = Quart(__name__, static_folder='static')
+app = cors(app)
+# Quart caps bodies at 16 MB by default; allow uploads up to the import limit
+app.config['MAX_CONTENT_LENGTH'] = int(IMPORT_MAX_UPLOAD_MB * 1024 * 1024)
+
+@app.errorhandler(413)
+async def request_too_large(e):
+    return jsonify({'error': f'File too large (limit {IMPORT_MAX_UPLOAD_MB:g} MB)'}), 413
+
+class FlaskFallback:
+    """Send requests for routes this app doesn't define to the Flask app
+
+    Only the busiest routes are rewritten here; the admin dashboard, events
+    and live stream keep running from server.py (in a worker thread), so
+    hypercorn can serve the whole site on its own.
+    """
+
+    def __init__(self, asgi_app, url_map):
+        self.asgi_app = asgi_app
+        self.url_map = url_map
+        self.flask_app = AsyncioWSGIMiddleware(
+            flask_app, max_body_size=int(IMPORT_MAX_UPLOAD_MB * 1024 * 1024)
+        )
+
+    def _handles(self, scope):
+        try:
+            self.url_map.bind('').match(scope['path'], method=scope['method'])
+            return True
+        except HTTPException:
+            return False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and not self._handles(scope):
+            return await self.flask_app(scope, receive, send)
+        return await self.asgi_app(scope, receive, send)
+
+app.asgi_app = FlaskFallback(app.asgi_app, app.url_map)
+
+# Render terminates TLS in a proxy; trust its X-Forwarded-For so
+# request.remote_addr is the real client (used for rate limiting)
+if 'RENDER' in os.environ:
+    from hypercorn.middleware import ProxyFixMiddleware
+    app.asgi_app = ProxyFixMiddleware(app.asgi_app, mode='legacy', trusted_hops=1)
+
+# ============= ASYNC DATABASE =============
+
+def _to_postgres(query):
+    """Rewrite ? placeholders as asyncpg's $1, $2, ..."""
+    parts = query.split('?')
+    return parts[0] + ''.join(f'${i}{part}' for i, part in enumerate(parts[1:], 1))
+
+def _to_sqlite(value):
+    """SQLite stores dates as ISO strings, same as the sync server"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+class AsyncConnection:
+    """Driver-neutral wrapper - queries use ? placeholders on both backends"""
+
+    def __init__(self, raw, backend):
+        self.raw = raw
+        self.backend = backend
+
+    async def _timed(self, query, coro):
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            words = query.lstrip().split(None, 1)
+            metrics.observe('db_query_duration_seconds', time.perf_counter() - start,
+                            {'backend': self.backend, 'statement': words[0].upper() if words else 'UNKNOWN'})
+
+    async def fetchone(self, query, *args):
+        if self.backend == 'postgresql-async':
+            return await self._timed(query, self.raw.fetchrow(_to_postgres(query), *args))
+        cursor = await self._timed(query, self.raw.execute(query, [_to_sqlite(a) for a in args]))
+        return await cursor.fetchone()
+
+    async def fetchall(self, query, *args):
+        if self.backend == 'postgresql-async':
+            return await self._timed(query, self.raw.fetch(_to_postgres(query), *args))
+        cursor = await self._timed(query, self.raw.execute(query, [_to_sqlite(a) for a in args]))
+        return await cursor.fetchall()
+
+    async def execute(self, query, *args):
+        """Run a statement and return the number of rows it touched"""
+        if self.backend == 'postgresql-async':
+            status = await self._timed(query, self.raw.execute(_to_postgres(query), *args))
+            last = status.split()[-1]
+            return int(last) if last.isdigit() else 0
+        cursor = await self._timed(query, self.raw.execute(query, [_to_sqlite(a) for a in args]))
+        return cursor.rowcount
+
+    @asynccontextmanager
+    async def savepoint(self, name='sp'):
+        """Roll back just this block on error, keeping the outer transaction"""
+        await self.raw.execute(f'SAVEPOINT {name}')
+        try:
+            yield self
+        except Exception:
+            await self.raw.execute(f'ROLLBACK TO SAVEPOINT {name}')
+            await self.raw.execute(f'RELEASE SAVEPOINT {name}')
+            raise
+        await self.raw.execute(f'RELEASE SAVEPOINT {name}')
+
+class SQLitePool:
+    """Tiny pool of aiosqlite connections (aiosqlite has none of its own)"""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self._idle = asyncio.Queue()
+
+    async def open(self):
+        import aiosqlite
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(self.path, isolation_level=None)
+            conn.row_factory = aiosqlite.Row
+            await conn.execute('PRAGMA busy_timeout = 5000')
+            self._idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def acquire(self):
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        while not self._idle.empty():
+            await self._idle.get_nowait().close()
+
+class AsyncDatabase:
+    """Async pool over asyncpg (PostgreSQL) or aiosqlite (SQLite)"""
+
+    def __init__(self):
+        self.pool = None
+        self.backend = None
+
+    async def open(self):
+        db_url = os.environ.get('DATABASE_URL')
+
+        if db_url:
+            import asyncpg
+            try:
+                self.pool = await asyncpg.create_pool(db_url, min_size=ASYNC_POOL_MIN, max_size=ASYNC_POOL_MAX)
+                self.backend = 'postgresql-async'
+                log_event(log, logging.INFO, 'async pool ready', backend=self.backend, size=ASYNC_POOL_MAX)
+                return
+            except Exception as e:
+                log_event(log, logging.ERROR, 'db connect failed, falling back to sqlite',
+                          backend='postgresql-async', error=str(e))
+
+        self.pool = SQLitePool(DATABASE, ASYNC_POOL_MAX)
+        await self.pool.open()
+        self.backend = 'sqlite-async'
+        log_event(log, logging.INFO, 'async pool ready', backend=self.backend, size=ASYNC_POOL_MAX)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+
+    @asynccontextmanager
+    async def transaction(self, readonly=False):
+        """Borrow a pooled connection for one transaction
+
+        SQLite write transactions take the write lock up front (BEGIN
+        IMMEDIATE) so concurrent ones wait on busy_timeout instead of
+        failing with "database is locked" when a read lock can't upgrade.
+        """
+        start = time.perf_counter()
+        async with self.pool.acquire() as raw:
+            metrics.observe('db_connect_seconds', time.perf_counter() - start, {'backend': self.backend})
+            conn = AsyncConnection(raw, self.backend)
+            if self.backend == 'postgresql-async':
+                async with raw.transaction():
+                    yield conn
+                return
+            await raw.execute('BEGIN' if readonly else 'BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                await raw.execute('ROLLBACK')
+                raise
+            await raw.execute('COMMIT')
+
+db = AsyncDatabase()
+
+@app.before_serving
+async def open_pool():
+    await db.open()
+    points_materializer.start()
+    claim_purger.start()
+
+@app.after_serving
+async def close_pool():
+    await db.close()
+
+# ============= REQUEST HOOKS =============
+
+@app.before_request
+async def start_request():
+    """Time the request, then apply the same rate limits as the sync server"""
+    g.request_start = time.perf_counter()
+    route = request.url_rule.rule if request.url_rule else None
+    if not route or not route.startswith('/api/'):
+        return None
+
+    check = (route, request.remote_addr, request.headers.get('Authorization'))
+    if rate_limiter.blocks(route):
+        # Shared buckets live in Redis; don't stall the loop on the round trip
+        wait = await asyncio.to_thread(rate_limiter.check, *check)
+    else:
+        wait = rate_limiter.check(*check)
+    if wait > 0:
+        response = jsonify({'error': 'Too many requests - please slow down'})
+        response.headers['Retry-After'] = str(max(1, int(wait + 0.999)))
+        return response, 429
+
+    if route in ADMISSION_EXEMPT_ROUTES:
+        return None
+
+    if not admission.try_enter():
+        metrics.inc('rate_limited_total', {'route': route, 'reason': 'overloaded'})
+        response = jsonify({'error': 'Server busy - please try again'})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+    g.admitted = True
+    return None
+
+@app.after_request
+async def record_request_metrics(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - start,
+                        {'route': route, 'method': request.method})
+        metrics.inc('http_requests_total',
+                    {'route': route, 'method': request.method, 'status': response.status_code})
+    return response
+
+@app.teardown_request
+async def release_request_state(exc):
+    if g.pop('admitted', False):
+        admission.leave()
+
+async def member_balance(conn, member_id):
+    """members.points plus ledger points not yet folded in, read in one statement"""
+    row = await conn.fetchone(BALANCE_QUERY.format(p='?'), member_id)
+    return row[0] if row else 0
+
+async def verify_token(conn, token):
+    """Verify if token is valid and return user info"""
+    result = await conn.fetchone('''
+        SELECT s.email, s.role, m.first_name, m.surname, m.member_number, m.is_admin
+        FROM sessions s
+        LEFT JOIN members m ON s.email = m.email
+        WHERE s.token = ? AND s.expires_at > ?
+    ''', token, datetime.now())
+
+    if result:
+        return {
+            'email': result[0],
+            'role': result[1],
+            'first_name': result[2],
+            'surname': result[3],
+            'member_number': result[4],
+            'is_admin': result[5]
+        }
+    return None
+
+async def resolve_event(conn, event_id=None, name=None):
+    """Find an event by id, or by name (creating it) - returns (id, name) or None"""
+    if event_id is not None:
+        row = await conn.fetchone('SELECT id, name FROM events WHERE id = ?', int(event_id))
+    else:
+        name = (name or '').strip() or 'General Access'
+        await conn.execute('INSERT INTO events (name) VALUES (?) ON CONFLICT (name) DO NOTHING', name)
+        row = await conn.fetchone('SELECT id, name FROM events WHERE name = ?', name)
+
+    if not row:
+        return None
+    event_directory.add(row[0], row[1])
+    return row[0], row[1]
+
+def _as_date(value):
+    """Parse an imported YYYY-MM-DD string into a date (asyncpg wants real dates)"""
+    if isinstance(value, str) and value:
+        return date.fromisoformat(value[:10])
+    return value
+
+def _expiry_datetime(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, datetime.max.time())
+    return value
+
+# ============= API ROUTES =============
+
+@app.route('/health')
+async def health():
+    return 'OK', 200
+
+@app.route('/metrics')
+async def prometheus_metrics():
+    """Prometheus-style metrics for this worker process"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/')
+async def index():
+    """Serve the main HTML file"""
+    return await send_from_directory('static', 'index.html')
+
+async def save_member(conn, member):
+    """Insert or update one prepared member and their family members"""
+    values = list(member_values(member))
+    if db.backend == 'postgresql-async':
+        values[7] = _as_date(values[7])
+
+    async with conn.savepoint():
+        await conn.execute('''
+            INSERT INTO members
+            (member_number, first_name, surname, email, phone, password_hash,
+             membership_type, expiry_date, status, photo_url, points, is_admin)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
+            ON CONFLICT (email)
+            DO UPDATE SET
+                member_number = EXCLUDED.member_number,
+                first_name = EXCLUDED.first_name,
+                surname = EXCLUDED.surname,
+                phone = EXCLUDED.phone,
+                membership_type = EXCLUDED.membership_type,
+                expiry_date = EXCLUDED.expiry_date,
+                status = EXCLUDED.status,
+                photo_url = EXCLUDED.photo_url,
+                is_admin = EXCLUDED.is_admin
+        ''', *values)
+
+        result = await conn.fetchone('SELECT id FROM members WHERE email = ?', member['email'])
+        member_id = result[0] if result else None
+
+        if member['family_members'] and member_id:
+            for fm in member['family_members']:
+                await conn.execute('''
+                    INSERT INTO family_members
+                    (primary_member_id, member_number, name, relationship)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (member_number)
+                    DO UPDATE SET
+                        name = EXCLUDED.name,
+                        relationship = EXCLUDED.relationship
+                ''', member_id, fm['member_number'], fm['name'], fm['relationship'])
+
+@app.route('/api/import-excel', methods=['POST'])
+async def import_excel():
+    """Import members from Excel file (Admin only)"""
+    data = (await request.get_json()).get('members', [])
+    imported = 0
+    errors = []
+
+    async with db.transaction() as conn:
+        user = await verify_token(conn, request.headers.get('Authorization'))
+        if not user or user['role'] != 'admin':
+            return jsonify({'error': 'Unauthorized - Admin access required'}), 401
+
+        for member_data in data:
+            try:
+                member = prepare_member(member_data)
+            except ValueError as e:
+                errors.append(str(e))
+                continue
+
+            try:
+                await save_member(conn, member)
+                imported += 1
+            except Exception as e:
+                errors.append(f"{member_data.get('member_number', 'Unknown')}: {str(e)}")
+
+    return jsonify({
+        'success': True,
+        'imported': imported,
+        'errors': errors
+    })
+
+@app.route('/api/import-file', methods=['POST'])
+async def import_file():
+    """Import members from an uploaded .xlsx or .csv file (Admin only)
+
+    Same form fields as server.py. Parsing runs in a worker thread so a
+    big workbook doesn't stall other requests; each chunk is saved in its
+    own transaction.
+    """
+    async with db.transaction(readonly=True) as conn:
+        user = await verify_token(conn, request.headers.get('Authorization'))
+    if not user or user['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 401
+
+    if request.content_length and request.content_length > IMPORT_MAX_UPLOAD_MB * 1024 * 1024:
+        return jsonify({'error': f'File too large (limit {IMPORT_MAX_UPLOAD_MB:g} MB)'}), 413
+
+    files = await request.files
+    form = await request.form
+    upload = files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    try:
+        column_map = load_column_map(form.get('mapping'))
+        sheets = [name.strip() for name in form.get('sheets', '').split(',') if name.strip()]
+        rows = await asyncio.to_thread(read_upload, upload.stream, upload.filename, column_map, sheets)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    report = ImportReport()
+    chunks = chunked(rows)
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                break
+            saved = []
+            async with db.transaction() as conn:
+                for sheet, row_number, member_data in chunk:
+                    if isinstance(member_data, ValueError):
+                        report.error(sheet, row_number, str(member_data), getattr(member_data, 'member_number', None))
+                        continue
+                    try:
+                        await save_member(conn, prepare_member(member_data))
+                        saved.append(sheet)
+                    except Exception as e:
+                        report.error(sheet, row_number, str(e), member_data.get('member_number'))
+            for sheet in saved:
+                report.ok(sheet)
+    except Exception as e:
+        # The file broke part-way through; earlier chunks stay imported
+        log_event(log, logging.WARNING, 'import file failed', filename=upload.filename, error=str(e))
+        return jsonify({'success': False, 'error': f'Could not read file: {e}', **report.as_dict()}), 400
+
+    log_event(log, logging.INFO, 'import file done', filename=upload.filename,
+              imported=report.imported, errors=report.error_count)
+    return jsonify({'success': True, **report.as_dict()})
+
+@app.route('/api/login', methods=['POST'])
+async def login():
+    """Login endpoint - email-based authentication"""
+    data = await request.get_json()
+    email = data.get('email', '').strip().lower()
+    password = data.get('password', '').strip()
+
+    if not email or not password:
+        return jsonify({'error': 'Email and password required'}), 400
+
+    async with db.transaction() as conn:
+        member = await conn.fetchone('SELECT * FROM members WHERE email = ?', email)
+
+        if not member or member['password_hash'] != hash_password(password):
+            return jsonify({'error': 'Invalid email or password'}), 401
+
+        role = 'admin' if member['is_admin'] == 1 else 'member'
+        token = generate_token()
+        await conn.execute(
+            'INSERT INTO sessions (email, token, role, expires_at) VALUES (?, ?, ?, ?)',
+            email, token, role, datetime.now() + timedelta(days=30)
+        )
+        points = await member_balance(conn, member['id'])
+
+    return jsonify({
+        'success': True,
+        'token': token,
+        'role': role,
+        'member': {
+            'member_number': member['member_number'],
+            'first_name': member['first_name'],
+            'surname': member['surname'],
+            'email': member['email'],
+            'membership_type': member['membership_type'],
+            'status': member['status'],
+            'points': points,
+            'is_admin': member['is_admin']
+        }
+    })
+
+@app.route('/api/member/profile', methods=['GET'])
+async def get_member_profile():
+    """Get member profile and attendance"""
+    async with db.transaction(readonly=True) as conn:
+        user = await verify_token(conn, request.headers.get('Authorization'))
+        if not user:
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        member = await conn.fetchone('SELECT * FROM members WHERE email = ?', user['email'])
+        if not member:
+            return jsonify({'error': 'Member not found'}), 404
+
+        family_members = await conn.fetchall('''
+            SELECT * FROM family_members
+            WHERE primary_member_id = (SELECT id FROM members WHERE email = ?)
+        ''', user['email'])
+
+        attendance = await conn.fetchall('''
+            SELECT * FROM attendance
+            WHERE member_number = ? OR member_number IN (
+                SELECT member_number FROM family_members
+                WHERE primary_member_id = (SELECT id FROM members WHERE email = ?)
+            )
+            ORDER BY timestamp DESC
+            LIMIT 50
+        ''', member['member_number'], user['email'])
+
+        member = dict(member)
+        member['points'] = await member_balance(conn, member['id'])
+
+    return jsonify({
+        'member': member,
+        'family_members': [dict(row) for row in family_members],
+        'attendance': [dict(row) for row in attendance]
+    })
+
+@app.route('/api/scan', methods=['POST'])
+async def scan_qr():
+    """Handle QR code scanning (Admin only)"""
+    data = await request.get_json()
+    scanned_member_number = data.get('member_number')
+    event_id = data.get('event_id')
+    event_name = data.get('event_name', 'General Access')
+    if event_id is not None and not str(event_id).isdigit():
+        return jsonify({'error': 'Invalid event id'}), 400
+
+    async with db.transaction(readonly=True) as conn:
+        user = await verify_token(conn, request.headers.get('Authorization'))
+    if not user or user['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 401
+
+    event = event_directory.get(event_id, event_name)
+    if not event:
+        # First scan for this event in this worker; naming a new event creates it
+        async with db.transaction() as conn:
+            event = await resolve_event(conn, event_id, event_name)
+    if not event:
+        return jsonify({'error': 'Event not found'}), 404
+    event_id, event_name = event
+
+    # Repeat scans inside the cooldown get the earlier decision, no writes
+    # and no write lock
+    dedup_key = scan_key(scanned_member_number, event_id)
+    previous = recent_scans.get(dedup_key)
+    if previous:
+        metrics.inc('scan_duplicates_total', {'source': 'memory'})
+        return jsonify(dict(previous, duplicate=True))
+
+    async with db.transaction() as conn:
+        member = await conn.fetchone('''
+            SELECT m.*, m.first_name || ' ' || m.surname as full_name
+            FROM members m
+            WHERE m.member_number = ?
+        ''', scanned_member_number)
+
+        if not member:
+            member = await conn.fetchone('''
+                SELECT m.*, fm.name as full_name, fm.member_number as scanned_number
+                FROM family_members fm
+                JOIN members m ON fm.primary_member_id = m.id
+                WHERE fm.member_number = ?
+            ''', scanned_member_number)
+            if not member:
+                return jsonify({
+                    'success': False,
+                    'status': 'error',
+                    'message': 'Member not found'
+                }), 404
+        member_name = member['full_name']
+
+        is_active = member['status'] == 'active' and _expiry_datetime(member['expiry_date']) > datetime.now()
+        points_awarded = 10 if is_active else 0
+        status = 'granted' if is_active else 'denied'
+
+        # Claim this member/event for the cooldown; another worker may
+        # already hold an unexpired claim
+        if recent_scans.enabled:
+            now = time.time()
+            claimed = await conn.execute('''
+                INSERT INTO scan_claims
+                (member_number, event_key, expires_at, member_name, status, points_awarded)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (member_number, event_key) DO UPDATE SET
+                    expires_at = EXCLUDED.expires_at,
+                    member_name = EXCLUDED.member_name,
+                    status = EXCLUDED.status,
+                    points_awarded = EXCLUDED.points_awarded
+                WHERE scan_claims.expires_at <= ?
+            ''', *dedup_key, now + recent_scans.cooldown, member_name, status, points_awarded, now)
+
+            if not claimed:
+                earlier = await conn.fetchone('''
+                    SELECT member_name, status, points_awarded, expires_at FROM scan_claims
+                    WHERE member_number = ? AND event_key = ?
+                ''', *dedup_key)
+                decision = scan_decision(member_name, status, points_awarded)
+                if earlier:
+                    decision = scan_decision(earlier[0], earlier[1], earlier[2])
+                    # Only for what is left of the other worker's claim
+                    recent_scans.put(dedup_key, decision, ttl=earlier[3] - now)
+                metrics.inc('scan_duplicates_total', {'source': 'database'})
+                return jsonify(dict(decision, duplicate=True))
+
+        scanned_at = datetime.now()
+        await conn.execute('''
+            INSERT INTO attendance
+            (member_number, member_name, event_id, event_name, scanned_by, timestamp, points_awarded, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', scanned_member_number, member_name, event_id, event_name, user['email'],
+            scanned_at, points_awarded, status)
+
+        # Award points to the primary member through the ledger
+        if is_active:
+            await conn.execute('''
+                INSERT INTO points_ledger (member_id, member_number, points, reason)
+                VALUES (?, ?, ?, ?)
+            ''', member['id'], scanned_member_number, points_awarded, 'attendance')
+
+    decision = scan_decision(member_name, status, points_awarded)
+    recent_scans.put(dedup_key, decision)
+
+    # Same live counters and dashboard feed as server.py; seeding a
+    # counter queries the database synchronously, so keep it off the loop
+    counts = await asyncio.to_thread(event_counters.record, event_id, scanned_member_number, status)
+    scan_broadcaster.publish({
+        'event_id': event_id,
+        'event_name': event_name,
+        'member_number': scanned_member_number,
+        'member_name': member_name,
+        'scanned_by': user['email'],
+        'timestamp': scanned_at.isoformat(),
+        'status': status,
+        'points_awarded': points_awarded,
+        'counts': counts
+    })
+    return jsonify(decision)
+
+@app.route('/api/events/stream')
+async def event_stream():
+    """Server-Sent Events feed of new scans (Admin only)
+
+    Served on the event loop rather than through server.py, where every
+    open stream would hold a thread. The token comes in ?token= because
+    EventSource can't send headers.
+    """
+    async with db.transaction(readonly=True) as conn:
+        user = await verify_token(conn, request.args.get('token'))
+
+    if not user or user['role'] != 'admin':
+        return jsonify({'error': 'Unauthorized - Admin access required'}), 401
+
+    response = Response(
+        scan_broadcaster.stream_async(scan_broadcaster.subscribe_async()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # The stream ends itself after SSE_MAX_SECONDS
+    response.timeout = None
+    return response
@@ -0,0 +1,328 @@
+"""
+Spreadsheet Import
+Reads uploaded member files (.xlsx or .csv) on the server one row at a
+time, so big Google Form exports are never parsed in the browser or held
+in memory whole.
+
+Every sheet in a workbook is read unless the upload names the sheets to
+use. Columns are matched to member fields by header name with COLUMN_MAP,
+which IMPORT_COLUMN_MAP or a single upload can override, e.g.
+    {"email": "E-mail", "phone": ["Cell", "Mobile"]}
+Rows are handed to the import in chunks of IMPORT_CHUNK_SIZE and every
+row that can't be imported is reported with its sheet and row number.
+"""
+
+import csv
+import itertools
+import json
+import os
+import re
+import zipfile
+from datetime import date, datetime, timedelta
+
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '200'))
+IMPORT_MAX_UPLOAD_MB = float(os.environ.get('IMPORT_MAX_UPLOAD_MB', '20'))
+IMPORT_MAX_ERRORS = 200  # errors listed per import; all of them are counted
+
+# Member field -> header names it may appear under (case and spacing ignored).
+# The defaults read the club's Google Form export as well as a plain sheet.
+COLUMN_MAP = {
+    'member_number': ['Member Number', 'Member #', 'Member No'],
+    'name': ['Name & Surname', 'Name and Surname', 'Full Name'],
+    'first_name': ['First Name'],
+    'surname': ['Surname', 'Last Name'],
+    'email': ['Email Adress', 'Email Address', 'Email'],
+    'phone': ['Contact Number', 'Phone'],
+    'membership_type': ['Membership Type'],
+    'expiry_date': ['Expiry Date'],
+    'status': ['Status'],
+    'photo_url': ['Upload profile picture', 'Photo URL', 'Photo'],
+    'is_admin': ['Is Admin', 'Admin'],
+    'spouse': ['If family Package - Details of spouse Name and surname', 'Spouse'],
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%d/%m/%Y', '%d-%m-%Y')
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+def _normalize(header):
+    return ' '.join(str(header or '').split()).lower()
+
+
+def _env_column_map():
+    """IMPORT_COLUMN_MAP is either JSON or the path of a JSON file"""
+    setting = os.environ.get('IMPORT_COLUMN_MAP', '').strip()
+    if not setting:
+        return None
+    if setting.startswith('{'):
+        return json.loads(setting)
+    with open(setting) as f:
+        return json.load(f)
+
+
+def load_column_map(overrides=None):
+    """COLUMN_MAP with IMPORT_COLUMN_MAP and then the upload's own mapping (a dict or JSON) applied"""
+    if isinstance(overrides, str):
+        try:
+            overrides = json.loads(overrides) if overrides.strip() else None
+        except ValueError:
+            raise ValueError('Column mapping is not valid JSON')
+    column_map = {field: list(headers) for field, headers in COLUMN_MAP.items()}
+    for source in (_env_column_map(), overrides):
+        if source is None:
+            continue
+        if not isinstance(source, dict):
+            raise ValueError('Column mapping must be an object of field: header(s)')
+        for field, headers in source.items():
+            if field not in COLUMN_MAP:
+                raise ValueError(f"Unknown field in column mapping: {field}")
+            column_map[field] = [headers] if isinstance(headers, str) else list(headers)
+    return column_map
+
+
+def _text(value):
+    """Cell value as the string the import expects"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        # Excel stores phone numbers typed without a leading 0 as numbers
+        return str(int(value))
+    return str(value).strip()
+
+
+class RowError(ValueError):
+    """A row that can't be imported, with the member number it gives (if any)"""
+
+    def __init__(self, message, member_number=None):
+        super().__init__(message)
+        self.member_number = member_number
+
+
+def _parse_date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value[:10], fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid expiry date: {value} (use YYYY-MM-DD)")
+
+
+def _one_year_from(today):
+    try:
+        return today.replace(year=today.year + 1)
+    except ValueError:
+        # 29 February
+        return today + timedelta(days=365)
+
+
+class SheetReader:
+    """Turns the rows of one sheet into member records
+
+    The first non-empty row is the header. Member numbers that aren't in
+    the file are numbered M1000, M1001, ... across the whole upload, the
+    same way the browser import numbers them.
+    """
+
+    def __init__(self, column_map, today=None):
+        self.column_map = column_map
+        self.today = today or date.today()
+        self.sequence = 0
+
+    def columns(self, header):
+        """Map each member field to its column index in this header row"""
+        positions = {_normalize(name): index for index, name in enumerate(header) if _normalize(name)}
+        fields = {}
+        for field, names in self.column_map.items():
+            for name in names:
+                if _normalize(name) in positions:
+                    fields[field] = positions[_normalize(name)]
+                    break
+        return fields
+
+    @staticmethod
+    def cell(fields, row, field):
+        """Text of one member field in a data row ('' if the sheet lacks it)"""
+        index = fields.get(field)
+        return _text(row[index]) if index is not None and index < len(row) else ''
+
+    def member(self, fields, row):
+        """Build the member record for one data row - raises ValueError if it is invalid"""
+        def cell(field):
+            return self.cell(fields, row, field)
+
+        member_number = cell('member_number') or f"M{1000 + self.sequence:04d}"
+        self.sequence += 1
+
+        first_name, surname = cell('first_name'), cell('surname')
+        if not first_name and not surname:
+            name_parts = cell('name').split()
+            first_name = name_parts[0] if name_parts else ''
+            surname = ' '.join(name_parts[1:])
+
+        email = cell('email').lower()
+        if not EMAIL_PATTERN.match(email):
+            raise ValueError(f"Invalid email: {email}" if email else 'Missing email')
+
+        expiry = cell('expiry_date')
+        expiry_date = _parse_date(expiry) if expiry else _one_year_from(self.today)
+
+        membership_type = cell('membership_type') or 'Solo'
+        member_data = {
+            'member_number': member_number,
+            'first_name': first_name,
+            'surname': surname,
+            'email': email,
+            'phone': cell('phone'),
+            'membership_type': membership_type,
+            'expiry_date': expiry_date.isoformat(),
+            'status': cell('status').lower() or 'active',
+            'is_admin': cell('is_admin') if 'is_admin' in fields else ('Yes' if 'admin' in email else 'No'),
+            'family_members': [],
+        }
+        if cell('photo_url'):
+            member_data['photo_url'] = cell('photo_url')
+
+        # Spouse details are one cell: name first, then ID, phone and email
+        spouse_lines = [line.strip() for line in cell('spouse').splitlines() if line.strip()]
+        if 'family' in membership_type.lower() and spouse_lines:
+            member_data['family_members'].append({
+                'name': spouse_lines[0],
+                'member_number': f"{member_number}-S1",
+                'relationship': 'Spouse'
+            })
+        return member_data
+
+    def read(self, sheet, rows):
+        """Yield (sheet, row_number, member_data or ValueError) for each data row
+
+        Invalid rows give a RowError carrying the row's member number.
+        """
+        fields = None
+        for row_number, row in enumerate(rows, 1):
+            if not any(_text(value) for value in row):
+                continue
+            if fields is None:
+                fields = self.columns(row)
+                if 'email' not in fields:
+                    yield sheet, row_number, ValueError('No Email column found - sheet skipped')
+                    return
+                continue
+            try:
+                yield sheet, row_number, self.member(fields, row)
+            except ValueError as e:
+                yield sheet, row_number, RowError(str(e), self.cell(fields, row, 'member_number') or None)
+
+
+def _csv_lines(stream):
+    """Decode an uploaded CSV line by line (UTF-8, or Excel's Windows-1252)"""
+    for line in stream:
+        try:
+            yield line.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            yield line.decode('cp1252', errors='replace')
+
+
+def _csv_sheets(stream):
+    lines = _csv_lines(stream)
+    first = next(lines, '')
+    # Excel in many locales saves CSVs with ; between columns
+    delimiter = max(',;\t', key=first.count)
+    yield 'CSV', csv.reader(itertools.chain([first], lines), delimiter=delimiter)
+
+
+def _xlsx_sheets(stream, sheets):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('Excel uploads need openpyxl (pip install openpyxl) - upload a CSV instead')
+
+    try:
+        # read_only streams each sheet's XML instead of loading the workbook
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, OSError) as e:
+        raise ValueError(f"Not a valid .xlsx file: {e}")
+
+    missing = [name for name in sheets or [] if name not in workbook.sheetnames]
+    if missing:
+        workbook.close()
+        raise ValueError(f"Sheet not found: {', '.join(missing)}")
+
+    def generate():
+        try:
+            for worksheet in workbook.worksheets:
+                if sheets and worksheet.title not in sheets:
+                    continue
+                # Some exporters write wrong sheet sizes; read what is really there
+                worksheet.reset_dimensions()
+                yield worksheet.title, worksheet.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    return generate()
+
+
+def read_upload(stream, filename, column_map, sheets=None, today=None):
+    """Open an uploaded file and return an iterator of (sheet, row_number, member_data or ValueError)
+
+    Raises ValueError straight away if the file can't be read at all.
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        sheet_rows = _csv_sheets(stream)
+    elif extension in ('.xlsx', '.xlsm'):
+        sheet_rows = _xlsx_sheets(stream, sheets)
+    else:
+        raise ValueError('Upload a .xlsx or .csv file (save older .xls files as .xlsx first)')
+
+    reader = SheetReader(column_map, today)
+    return itertools.chain.from_iterable(reader.read(sheet, rows) for sheet, rows in sheet_rows)
+
+
+def chunked(iterable, size=None):
+    """Yield lists of up to size items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size or IMPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+class ImportReport:
+    """Counts per sheet plus the first IMPORT_MAX_ERRORS row errors"""
+
+    def __init__(self, max_errors=IMPORT_MAX_ERRORS):
+        self.max_errors = max_errors
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+        self.sheets = {}
+
+    def _sheet(self, sheet):
+        return self.sheets.setdefault(sheet, {'imported': 0, 'errors': 0})
+
+    def ok(self, sheet):
+        self.imported += 1
+        self._sheet(sheet)['imported'] += 1
+
+    def error(self, sheet, row, message, member_number=None):
+        self.error_count += 1
+        self._sheet(sheet)['errors'] += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({
+                'sheet': sheet,
+                'row': row,
+                'member_number': member_number,
+                'error': message
+            })
+
+    def as_dict(self):
+        return {
+            'imported': self.imported,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'sheets': self.sheets
+        }
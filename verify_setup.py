@@ -40,6 +40,14 @@ def main():
     print("Required Files:")
     files_to_check = [
         ("server.py", "Backend server"),
+        ("instrumentation.py", "Logging and metrics"),
+        ("scan_dedup.py", "Duplicate scan protection"),
+        ("rate_limit.py", "Rate limiting"),
+        ("events.py", "Live event counters"),
+        ("db_routing.py", "Read replica routing"),
+        ("points_ledger.py", "Points ledger"),
+        ("spreadsheet_import.py", "Excel/CSV import"),
+        ("server_async.py", "Async server (optional)"),
         ("static/index.html", "Frontend interface"),
         ("add_admin.py", "Admin setup script"),
         ("requirements.txt", "Dependencies"),
@@ -71,6 +79,14 @@ def main():
         print("     Run: pip install -r requirements.txt")
         all_good = False
     
+    try:
+        import openpyxl
+        print("  ✅ openpyxl installed")
+    except ImportError:
+        print("  ❌ openpyxl not installed (needed to import .xlsx files)")
+        print("     Run: pip install -r requirements.txt")
+        all_good = False
+    
     print()
     
     # Check database